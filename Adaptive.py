@@ -0,0 +1,35 @@
+class AdaptiveRates(object):
+    '''
+    Controller of the mutation and radiation rates driven by the diversity
+    of the population (see Population.population_diversity). While the
+    diversity stays above target the base rates are used; below target the
+    rates rise linearly with the loss of diversity, up to max_mutation and
+    max_radiation for a population of clones
+    '''
+
+    __slots__ = ('target', 'mutation_base', 'radiation_base', 'max_mutation', 'max_radiation',
+                 'diversity')
+
+    def __init__(self, target, mutation_base, radiation_base, max_mutation=1.0,
+                 max_radiation=0.1):
+        if not 0 < target <= 1:
+            raise ValueError('Seuil de diversite invalide: %s' % target)
+        self.target = target
+        self.mutation_base = mutation_base
+        self.radiation_base = radiation_base
+        self.max_mutation = max(max_mutation, mutation_base)
+        self.max_radiation = max(max_radiation, radiation_base)
+
+        #  diversity measured at the last update
+        self.diversity = None
+
+    def update(self, diversity):
+        '''
+        Returns the (mutation, radiation) rates for a population of the given
+        diversity
+        '''
+        self.diversity = diversity
+        collapse = max(0.0, (self.target - diversity) / self.target)
+        mutation = self.mutation_base + (self.max_mutation - self.mutation_base) * collapse
+        radiation = self.radiation_base + (self.max_radiation - self.radiation_base) * collapse
+        return mutation, radiation
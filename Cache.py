@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+
+class FitnessCache(object):
+    '''
+    Bounded LRU cache of fitness results keyed on packed chromosomes
+    (see Population.chromosome_key). When full, the least recently used
+    entry is evicted
+    '''
+
+    __slots__ = ('capacity', 'entries', 'hits', 'misses')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''
+        Returns the cached value of key or None
+        '''
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        '''
+        Store a value, evicting the least recently used entry if needed
+        '''
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
@@ -0,0 +1,40 @@
+'''
+Checkpoints of a run: the state of a Population (see Population.get_state)
+is saved in a binary file so that an interrupted run can be resumed.
+The file is first written under a temporary name then renamed over the
+previous checkpoint, a crash during a write never leaves a truncated file.
+'''
+
+import cPickle as pickle
+import os
+
+#  header of a checkpoint file: magic string and format version
+MAGIC = 'NQCK'
+VERSION = 1
+
+
+def save_checkpoint(path, state):
+    '''
+    Atomically write a state to path
+    '''
+    tmp = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(chr(VERSION))
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+def load_checkpoint(path):
+    '''
+    Read a state written by save_checkpoint
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Fichier de reprise invalide: %s' % path)
+        version = ord(f.read(1))
+        if version != VERSION:
+            raise ValueError('Version de fichier de reprise inconnue: %i' % version)
+        return pickle.load(f)
@@ -0,0 +1,302 @@
+import os
+import time
+from multiprocessing import Process, Pipe
+
+from Population import Population, chromosome_key, derive_seed, write_solutions
+from PopulationFile import SolutionWriter
+from Statistics import Profiler
+from Symmetry import canonical_form, symmetries
+
+
+def island_file(path, i):
+    '''
+    Name of the file of island i (numbered from 1) for a file option of
+    the run: the number is added before the extension (history.txt gives
+    history_1.txt)
+    '''
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    return '%s_%i%s' % (root, i, ext)
+
+
+def island_main(conn, N, solutions, xover_prob, mutation_prob, options):
+    '''
+    Body of an island process: evolve a Population on request of the
+    Archipelago and exchange migrants with it through a pipe
+    '''
+    Pop = Population(N, solutions, xover_prob, mutation_prob, **options)
+    reported = 0
+    while True:
+        message = conn.recv()
+        if message[0] == 'stop':
+            break
+
+        generations, immigrants, migrants = message[1:]
+        Pop.replace_worst(immigrants)
+        for i in xrange(generations):
+            Pop.next_generation()
+
+        #  only the solutions found since the last report are sent
+        new_solutions = Pop.optimal_solutions[reported:]
+        reported = len(Pop.optimal_solutions)
+        phases = None
+        if Pop.profiler is not None:
+            phases = Pop.profiler.phases
+        conn.send((Pop.get_best_individuals(migrants), new_solutions, Pop.get_best_fitness(),
+                   Pop.get_barometer_count(), Pop.generation, len(Pop.population), phases))
+
+    Pop.close()
+    conn.close()
+
+
+class Archipelago(object):
+    '''
+    Island model: independent populations evolve in their own process and
+    exchange their best individuals every few generations. With the ring
+    topology island i receives the migrants of island i - 1, with the full
+    topology it receives the migrants of every other island.
+    Each island writes its own history and telemetry files (see island_file),
+    the profiles of the islands are added up
+    '''
+
+    def __init__(self, N, populations, xover_prob, mutation_prob, topology='ring',
+                 migration_interval=10, migrants=2, **options):
+        if topology not in ('ring', 'full'):
+            raise ValueError('Topologie inconnue: %s' % topology)
+
+        self.N = N
+        self.xover_probability = xover_prob
+        self.mutation_probability = mutation_prob
+        self.topology = topology
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.symmetry = options.get('symmetry', False)
+        self.profile = options.get('profile', False)
+        self.barometer = options.get('barometer', 'exact')
+
+        #  islands can not share a pool of processes
+        options['workers'] = 1
+        history_file = options.pop('history_file', None)
+        telemetry_file = options.pop('telemetry_file', None)
+
+        #  each island has its own random stream derived from the seed
+        self.seed = options.pop('seed', None)
+
+        #  merged results of all islands
+        self.optimal_solutions = []
+        self.optimal_keys = set()
+        self.fundamental_keys = set()
+        self.best_fitness = None
+        self.generation = 0
+        self.solution_writer = None
+
+        #  last report of each island
+        self.reports = [None] * len(populations)
+
+        self.connections = []
+        self.processes = []
+        for i in xrange(len(populations)):
+            parent_conn, child_conn = Pipe()
+            island_options = dict(options, seed=derive_seed(self.seed, i + 1),
+                                  history_file=island_file(history_file, i + 1),
+                                  telemetry_file=island_file(telemetry_file, i + 1))
+            p = Process(target=island_main,
+                        args=(child_conn, N, populations[i], xover_prob, mutation_prob,
+                              island_options))
+            p.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(p)
+
+    def get_immigrants(self, i):
+        '''
+        Returns the migrants sent to island i according to the topology
+        '''
+        if self.reports[i] is None:
+            return []
+        K = len(self.reports)
+        if self.topology == 'ring':
+            return self.reports[(i - 1) % K][0]
+        immigrants = []
+        for j in xrange(K):
+            if j != i:
+                immigrants.extend(self.reports[j][0])
+        return immigrants
+
+    def evolve(self, generations):
+        '''
+        Migrate, then evolve every island for the given number of generations
+        '''
+        for i in xrange(len(self.connections)):
+            self.connections[i].send(('evolve', generations, self.get_immigrants(i), self.migrants))
+        for i in xrange(len(self.connections)):
+            self.reports[i] = self.connections[i].recv()
+            for s in self.reports[i][1]:
+                self.add_optimal_solution(s)
+            best = self.reports[i][2]
+            if self.best_fitness is None or best > self.best_fitness:
+                self.best_fitness = best
+        self.generation += generations
+
+    def add_optimal_solution(self, sol):
+        '''
+        Merge a solution found by an island
+        '''
+        canonical_key = chromosome_key(canonical_form(sol))
+        if self.symmetry:
+            if canonical_key in self.fundamental_keys:
+                return
+        elif chromosome_key(sol) in self.optimal_keys:
+            return
+        self.optimal_keys.add(chromosome_key(sol))
+        if self.symmetry:
+            for image in symmetries(sol):
+                self.optimal_keys.add(chromosome_key(image))
+        self.fundamental_keys.add(canonical_key)
+        self.optimal_solutions.append(sol)
+        if self.solution_writer is not None:
+            self.solution_writer.write(sol)
+
+    def stream_solutions(self, outfile, solutions_format='text'):
+        '''
+        Write the merged solutions to outfile as soon as they are received
+        (see Population.stream_solutions)
+        '''
+        self.solution_writer = SolutionWriter(outfile, self.N, solutions_format)
+        self.solution_writer.write_many(self.optimal_solutions)
+
+    def run(self, max_iter, stop_first=False, stop_after=None, time_limit=None,
+            stagnation=None, progress=None):
+        '''
+        Evolve the islands until max_iter generations or until a stopping
+        criterion is met (see run_genetic_algorithm in n-queens.py). Criteria
+        are checked at every migration. Returns the reason why it stopped
+        '''
+        start = time.time()
+        best = None
+        last_improvement = 0
+
+        while self.generation < max_iter:
+            if stop_first and self.optimal_solutions:
+                return 'premiere solution trouvee'
+            if stop_after and len(self.optimal_solutions) >= stop_after:
+                return '%i solutions trouvees' % len(self.optimal_solutions)
+            if time_limit and time.time() - start >= time_limit:
+                return 'budget de temps ecoule'
+            if stagnation and self.generation - last_improvement >= stagnation:
+                return 'aucune amelioration depuis %i generations' % stagnation
+
+            if progress is not None:
+                progress('Iteration=%i' % self.generation)
+            self.evolve(min(self.migration_interval, max_iter - self.generation))
+
+            if best is None or self.best_fitness > best:
+                best = self.best_fitness
+                last_improvement = self.generation
+
+        return 'nombre maximal de generations atteint'
+
+    def get_barometer_count(self):
+        return sum(r[3] for r in self.reports if r is not None)
+
+    def get_best_fitness(self):
+        return self.best_fitness
+
+    def get_population_size(self):
+        return sum(r[5] for r in self.reports if r is not None)
+
+    def get_profiler(self):
+        '''
+        Returns a Profiler adding up the profiles of the islands (None when
+        the run is not profiled)
+        '''
+        if not self.profile:
+            return None
+        profiler = Profiler()
+        for report in self.reports:
+            if report is not None:
+                for phase, seconds in report[6].iteritems():
+                    profiler.add(phase, seconds)
+        return profiler
+
+    def print_stats(self):
+        '''
+        Print relevant stats
+        '''
+        print
+        print '================================================='
+        print 'Statistiques:'
+        print 'Nombre de reines:', self.N
+        print 'Nombre d\'iles:', len(self.processes)
+        print 'Topologie de migration:', self.topology
+        print 'Taille de la population:', self.get_population_size()
+        print 'Nombre de generations:', self.generation
+        print 'Probabilite de recombinaison:', self.xover_probability
+        print 'Probabilite de mutation:', self.mutation_probability
+        if self.seed is not None:
+            print 'Graine aleatoire:', self.seed
+        print 'Fitness de la meilleure solution:', self.get_best_fitness()
+        if self.barometer == 'exact':
+            print 'Temps de calcul:', self.get_barometer_count()
+        else:
+            print 'Temps de calcul: barometre desactive'
+        print 'Solutions distinctes:', len(self.optimal_solutions)
+        if self.symmetry:
+            print 'Solutions connues (images comprises):', len(self.optimal_keys)
+        print 'Solutions fondamentales:', len(self.fundamental_keys)
+        profiler = self.get_profiler()
+        if profiler is not None:
+            for phase, seconds, share in profiler.report():
+                print 'Temps %s: %.3fs (%.1f%%)' % (phase, seconds, share)
+        print '================================================='
+
+    def export_stats(self, outfile):
+        '''
+        Function to export stats to text file.
+        '''
+        with open(outfile, 'w') as f:
+            f.write('Statistiques:\n')
+            f.write('Nombre de reines: %i\n' % self.N)
+            f.write('Nombre d\'iles: %i\n' % len(self.processes))
+            f.write('Topologie de migration: %s\n' % self.topology)
+            f.write('Taille de la population: %i\n' % self.get_population_size())
+            f.write('Nombre de generation: %i\n' % self.generation)
+            f.write('Probabilite de recombinaison: %f\n' % self.xover_probability)
+            f.write('Probabilite de mutation: %f\n' % self.mutation_probability)
+            if self.seed is not None:
+                f.write('Graine aleatoire: %i\n' % self.seed)
+            f.write('Fitness de la meilleure solution: %i\n' % self.get_best_fitness())
+            if self.barometer == 'exact':
+                f.write('Temps de calcul: %i\n' % self.get_barometer_count())
+            else:
+                f.write('Temps de calcul: barometre desactive\n')
+            profiler = self.get_profiler()
+            if profiler is not None:
+                for phase, seconds, share in profiler.report():
+                    f.write('Temps %s: %.3fs (%.1f%%)\n' % (phase, seconds, share))
+            f.write('Solutions distinctes: %i\n' % len(self.optimal_solutions))
+            if self.symmetry:
+                f.write('Solutions connues (images comprises): %i\n' % len(self.optimal_keys))
+            f.write('Solutions fondamentales: %i' % len(self.fundamental_keys))
+
+    def export_optimal_solutions(self, outfile):
+        '''
+        Write the optimal solutions found by all islands to a text file
+        '''
+        write_solutions(outfile, self.optimal_solutions)
+
+    def close(self):
+        '''
+        Stop the island processes
+        '''
+        for conn in self.connections:
+            conn.send(('stop',))
+            conn.close()
+        for p in self.processes:
+            p.join()
+        self.connections = []
+        self.processes = []
+        if self.solution_writer is not None:
+            self.solution_writer.close()
+            self.solution_writer = None
@@ -1,45 +1,204 @@
-from random import randint, sample, random, choice, shuffle
+from random import Random
+from array import array
+from multiprocessing import Pool
+from heapq import heapify, heappop, heappush, nlargest, nsmallest
+from hashlib import sha1
+from time import time
+from Statistics import FitnessHistory, Profiler, Telemetry
+from Symmetry import symmetries
+from Cache import FitnessCache
+from Adaptive import AdaptiveRates
+from PopulationFile import SolutionWriter, chromosome_typecode
 
+#  numpy is optional, it is used to evaluate the whole population at once
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-class Population:
+
+class Population(object):
     '''
     Class used to manipulation population object
     '''
 
-    def __init__(self, N, solutions, xover_prob, mutation_prob):
+    __slots__ = ('N', 'compact', 'fitness_engine', 'incremental', 'pool', 'workers',
+                 'baro', 'xover_probability', 'mutation_probability',
+                 'population', 'optimal_solutions', 'solutions', 'fitness_vals',
+                 'counters', 'offspring', 'history', 'generation', 'dedup',
+                 'optimal_keys', 'fundamental_keys', 'symmetry', 'cache',
+                 'selection', 'tournament_size', 'crossover',
+                 'memetic_steps', 'memetic_top', 'baro_memetic', 'evaluations',
+                 'first_solution_generation', 'seed', 'rng',
+                 'barometer', 'profiler', 'telemetry', 'solution_writer',
+                 'steady_state', 'worst_heap', 'heap_sum', 'heap_best',
+                 'mutation_rate', 'radiation_rate', 'adaptive')
+
+    def __init__(self, N, solutions, xover_prob, mutation_prob, fitness_engine=None,
+                 compact=False, history_size=100, history_file=None, dedup=False,
+                 symmetry=False, cache_size=0, workers=1,
+                 selection='sort', tournament_size=3, crossover='legacy',
+                 memetic_steps=0, memetic_top=2, seed=None,
+                 barometer='exact', profile=False, telemetry_file=None, steady_state=0,
+                 adaptive=None, append_files=False):
         #  number of queens
         self.N = N
 
+        #  random number generator of the population, every random choice of
+        #  the algorithm goes through it so a seed reproduces a run
+        self.seed = seed
+        self.rng = Random(seed)
+
+        #  in compact mode chromosomes are packed in a ChromosomeBuffer and
+        #  fitness values in an array
+        self.compact = compact
+
+        #  fitness function used to evaluate chromosomes
+        if fitness_engine is None:
+            fitness_engine = DEFAULT_FITNESS_ENGINE
+        if fitness_engine not in FITNESS_ENGINES:
+            raise ValueError('Moteur de fitness inconnu: %s' % fitness_engine)
+        self.fitness_engine = fitness_engine
+
+        #  parent selection strategy (see select_parents)
+        if selection not in SELECTION_STRATEGIES:
+            raise ValueError('Strategie de selection inconnue: %s' % selection)
+        self.selection = selection
+        self.tournament_size = tournament_size
+
+        #  crossover operator (see CROSSOVER_OPERATORS)
+        if crossover not in CROSSOVER_OPERATORS:
+            raise ValueError('Operateur de recombinaison inconnu: %s' % crossover)
+        self.crossover = crossover
+
+        #  with the diagonal engines each individual carries its diagonal
+        #  counters so a swap mutation can be scored incrementally
+        #  (counters are not kept in compact mode to save memory)
+        self.incremental = fitness_engine in ('diagonal', 'numpy') and not compact
+
+        #  persistent pool of processes evaluating the population in chunks
+        self.workers = workers
+        self.pool = None
+        if workers > 1:
+            self.pool = Pool(workers)
+
         self.baro = 1
 
+        #  barometer mode: exact counts every operation, off uses the fitness
+        #  engines without counting (the count is then not reported)
+        if barometer not in ('exact', 'off'):
+            raise ValueError('Mode de barometre inconnu: %s' % barometer)
+        self.barometer = barometer
+
+        #  time spent in each phase of the algorithm
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler()
+
+        #  memetic mode: local search budget (swaps per generation) applied to
+        #  the memetic_top best solutions, its operations are counted apart
+        self.memetic_steps = memetic_steps
+        self.memetic_top = memetic_top
+        self.baro_memetic = 0
+
+        #  steady-state mode: number of children replacing the least fit
+        #  individuals at each step (0 for the generational mode), see
+        #  steady_state_step
+        if steady_state > 0 and memetic_steps > 0:
+            raise ValueError('Le mode memetique n\'est pas disponible en mode stationnaire')
+        self.steady_state = steady_state
+        self.worst_heap = None
+
+        #  sum and best of the fitness values of the heap, kept up to date by
+        #  steady_state_step for the statistics of each step
+        self.heap_sum = 0
+        self.heap_best = None
+
+        #  number of fitness evaluations actually computed
+        self.evaluations = 0
+
         #  probability constants
         self.xover_probability = xover_prob
         self.mutation_probability = mutation_prob
 
+        #  rates of mutation and radiation (severe mutation) applied to the
+        #  children, adapted to the diversity of the population if adaptive
+        #  is the diversity under which they rise (see Adaptive.py)
+        self.mutation_rate = mutation_prob
+        self.radiation_rate = RADIATION_PROBABILITY
+        self.adaptive = None
+        if adaptive is not None:
+            self.adaptive = AdaptiveRates(adaptive, mutation_prob, RADIATION_PROBABILITY)
+
         #  list containing solutions in Board object form
         self.population = []
 
         #  list containing optimal solutions
         self.optimal_solutions = []
 
+        #  keys (see chromosome_key) of the optimal solutions
+        self.optimal_keys = set()
+
+        #  generation in which the first optimal solution was found
+        self.first_solution_generation = None
+
+        #  keys of the canonical forms of the optimal solutions (one key for
+        #  all the rotations and reflections of a solution)
+        self.fundamental_keys = set()
+
+        #  in symmetry mode, the images of a solution found are known as
+        #  optimal and are neither rescored nor recorded again
+        self.symmetry = symmetry
+
+        #  LRU cache of fitness results shared between generations
+        self.cache = None
+        if cache_size > 0:
+            self.cache = FitnessCache(cache_size)
+
+        #  evaluate only once the identical solutions of a generation
+        self.dedup = dedup
+
         #  list containing solutions in list form
+        if compact:
+            solutions = ChromosomeBuffer(N, solutions)
+        elif not isinstance(solutions, list):
+            #  rows of a file mapped in memory (see PopulationFile.MappedPopulation)
+            solutions = list(solutions)
         self.solutions = solutions
 
         #  list of fitness values
-        self.fitness_vals = []
+        self.fitness_vals = self.new_fitness_vals()
 
-        #  list to hold all fitness results
-        self.all_fitness_results = []
+        #  list of [fitness, diagonals, anti-diagonals] for each individual
+        #  (diagonals are None when fitness is not evaluated incrementally)
+        self.counters = []
 
-        #  create board objects with each solution
-        self.create_population(N)
+        #  last generation built and the known scores of its children
+        self.offspring = None
+
+        #  running statistics of the fitness results (the files of a resumed
+        #  run are appended to, see from_state)
+        self.history = FitnessHistory(history_size, history_file, append=append_files)
+
+        #  optional JSON lines record of every generation
+        self.telemetry = None
+        if telemetry_file is not None:
+            self.telemetry = Telemetry(telemetry_file, append=append_files)
+
+        #  optional file receiving the optimal solutions as they are found
+        #  (see stream_solutions)
+        self.solution_writer = None
 
         #  attribute representing generation
         self.generation = 0
 
-    def create_population(self, N):
+        #  create board objects with each solution
+        self.create_population(N)
+
+    def create_population(self, N, scores=None):
         '''
         Take each solution and add to population (if no duplicates in sol)
+        If scores are given, solutions with a known score are not evaluated
         '''
         i = 0
         for s in self.solutions:
@@ -48,26 +207,161 @@ class Population:
             #  we check if the solution contains duplicates (queens on two rows)
             if len(s) == len(set(s)):
                 self.baro += 1
-                self.population.append(s)
+                if not self.compact:
+                    self.population.append(s)
 
             #  if solution contains duplicate we generate another
             else:
                 self.baro += 1
                 s1 = self.generate_random_solution()
-                self.population.append(s1)
+                if not self.compact:
+                    self.population.append(s1)
                 self.solutions[i] = s1
 
             i += 1
 
-        for s in self.population:
+        #  the compact population shares the buffer of the solutions
+        if self.compact:
+            self.population = self.solutions
+
+        profiler = self.profiler
+        if profiler is not None:
+            start = time()
+
+        population = self.population
+        size = len(population)
+        fit_vals, scores = self.score_rows(population, scores)
+
+        if profiler is not None:
+            profiler.add('evaluation', time() - start)
+
+        #  memetic mode: improve the best solutions with a local search
+        if self.memetic_steps > 0 and size > 0:
+            if profiler is not None:
+                start = time()
+            self.local_search(population, fit_vals, scores)
+            if profiler is not None:
+                profiler.add('local_search', time() - start)
+
+        i = 0
+        for s in population:
             self.baro += 1
-            fit_val, b = calc_fitness(s)
+            fit_val = fit_vals[i]
             if fit_val == 0:
-                if s not in self.optimal_solutions:
-                    self.optimal_solutions.append(s)
-            self.baro += b
+                key = chromosome_key(s)
+                if key not in self.optimal_keys:
+                    self.add_optimal_solution(s, key)
             self.fitness_vals.append(fit_val)
-            self.all_fitness_results.append(fit_val)
+            self.counters.append(scores[i])
+            self.history.record(fit_val)
+            i += 1
+
+        self.end_generation(population)
+
+    def add_optimal_solution(self, sol, key):
+        '''
+        Record a new optimal solution and its canonical form
+        '''
+        if self.first_solution_generation is None:
+            self.first_solution_generation = self.generation
+        images = symmetries(sol)
+        self.baro += len(images)
+        self.fundamental_keys.add(chromosome_key(min(images)))
+        self.optimal_solutions.append(sol)
+        self.optimal_keys.add(key)
+        if self.symmetry:
+            for image in images:
+                self.optimal_keys.add(chromosome_key(image))
+        if self.solution_writer is not None:
+            self.solution_writer.write(sol)
+
+    def stream_solutions(self, outfile, solutions_format='text'):
+        '''
+        Write the optimal solutions to outfile as soon as they are found (the
+        solutions already known first), see PopulationFile.SolutionWriter
+        '''
+        self.solution_writer = SolutionWriter(outfile, self.N, solutions_format)
+        self.solution_writer.write_many(self.optimal_solutions)
+
+    def count_distinct_solutions(self):
+        '''
+        Number of distinct optimal solutions found
+        '''
+        return len(self.optimal_solutions)
+
+    def count_known_solutions(self):
+        '''
+        Number of optimal solutions known, in symmetry mode the images of
+        the solutions found are included
+        '''
+        return len(self.optimal_keys)
+
+    def count_fundamental_solutions(self):
+        '''
+        Number of optimal solutions up to rotations and reflections
+        '''
+        return len(self.fundamental_keys)
+
+    def score_parallel(self, solutions):
+        '''
+        Evaluate solutions with the pool of processes. The solutions are
+        split in one chunk per worker and shipped as packed arrays.
+        Returns the scores (same order as solutions) and the barometer count
+        '''
+        N = self.N
+        typecode = chromosome_typecode(N)
+        chunk_size = (len(solutions) + self.workers - 1) // self.workers
+        tasks = []
+        for start in xrange(0, len(solutions), chunk_size):
+            if isinstance(solutions, ChromosomeBuffer):
+                rows = solutions.data[start * N:(start + chunk_size) * N]
+            else:
+                rows = array(typecode)
+                for sol in solutions[start:start + chunk_size]:
+                    rows.extend(sol)
+            tasks.append((N, self.fitness_engine, self.incremental, self.barometer == 'exact',
+                          rows.tostring()))
+
+        scores = []
+        baro = 0
+        width = 2 * N - 1
+        for packed_fitness, b, packed_counters in self.pool.map(score_packed, tasks):
+            baro += b
+            fit_vals = array('i')
+            fit_vals.fromstring(packed_fitness)
+            if packed_counters is None:
+                for fit_val in fit_vals:
+                    scores.append([fit_val, None, None])
+            else:
+                counters = array(typecode)
+                counters.fromstring(packed_counters)
+                for k in xrange(len(fit_vals)):
+                    start = 2 * width * k
+                    scores.append([fit_vals[k], counters[start:start + width].tolist(),
+                                   counters[start + width:start + 2 * width].tolist()])
+        return scores, baro
+
+    def close(self):
+        '''
+        Stop the pool of processes and close the fitness history
+        '''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.history.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.solution_writer is not None:
+            self.solution_writer.close()
+
+    def new_fitness_vals(self):
+        '''
+        Returns an empty container for fitness values
+        '''
+        if self.compact:
+            return array('i')
+        return []
 
     def generate_random_solution(self):
         '''
@@ -83,7 +377,7 @@ class Population:
             self.baro += 1
 
         #  shuffle the list
-        shuffle(sol)
+        self.rng.shuffle(sol)
         return sol
 
     def one_point_xover(self, sol1, sol2):
@@ -92,7 +386,7 @@ class Population:
         and constructs the children with a half from each parent
         '''
         size = self.N
-        pt = randint(0, size - 1)
+        pt = self.rng.randint(0, size - 1)
         child = [None] * self.N
         child[0:pt] = sol1[0:pt]
         child[pt:] = sol2[pt:]
@@ -110,7 +404,7 @@ class Population:
             self.baro += 1
             sol2 = self.generate_random_solution()
 
-        x = random()
+        x = self.rng.random()
         if x < self.xover_probability:
             child = self.one_point_xover(sol1, sol2)
             return child
@@ -134,17 +428,171 @@ class Population:
             self.baro += 1
             if(child[i] == -1):
                 self.baro += 1
-                child[i] = choice(possible)
+                child[i] = self.rng.choice(possible)
                 possible.remove(child[i])
 
         return child
 
-    def mutate_child(self, sol):
+    def local_search(self, population, fit_vals, scores):
+        '''
+        Swap-based hill climbing applied to the memetic_top best solutions.
+        The step budget of the generation (memetic_steps) is shared between
+        them. Each step swaps a queen in conflict with a random queen and keeps
+        the swap if it does not increase the number of conflicts. The
+        diagonal counters make each step O(1). Operations are counted in
+        baro_memetic
+        '''
+        N = self.N
+        off = N - 1
+        last = N - 1
+        randint = self.rng.randint
+        best = nlargest(self.memetic_top, xrange(len(fit_vals)), key=fit_vals.__getitem__)
+        steps = max(1, self.memetic_steps // len(best))
+
+        for j in best:
+            if fit_vals[j] == 0:
+                continue
+
+            #  work on a copy, the solution may be shared with other individuals
+            sol = population[j][:]
+            fit_val, b, diags, anti_diags = diagonal_counters(sol)
+            self.baro_memetic += b
+
+            for step in xrange(steps):
+                if fit_val == 0:
+                    break
+
+                #  look for a queen in conflict
+                i = randint(0, last)
+                tries = 0
+                while diags[i - sol[i] + off] < 2 and anti_diags[i + sol[i]] < 2 and tries < N:
+                    self.baro_memetic += 1
+                    i = randint(0, last)
+                    tries += 1
+
+                k = randint(0, last)
+                if k == i:
+                    continue
+                self.baro_memetic += 1
+                delta = swap_delta(sol, diags, anti_diags, i, k)
+                sol[i], sol[k] = sol[k], sol[i]
+                if delta > 0:
+                    #  undo the swap
+                    swap_delta(sol, diags, anti_diags, i, k)
+                    sol[i], sol[k] = sol[k], sol[i]
+                else:
+                    fit_val -= delta
+
+            population[j] = sol
+            self.solutions[j] = sol
+            fit_vals[j] = fit_val
+            if self.incremental:
+                scores[j] = [fit_val, diags, anti_diags]
+            else:
+                scores[j] = [fit_val, None, None]
+
+    def cut_points(self):
+        '''
+        Returns two random cut points a < b delimiting a segment of the chromosome
+        '''
+        a = self.rng.randint(0, self.N - 1)
+        b = self.rng.randint(0, self.N - 1)
+        if a > b:
+            a, b = b, a
+        return a, b + 1
+
+    def pmx_xover(self, sol1, sol2):
+        '''
+        Partially mapped crossover: the child takes a segment of sol1 and the
+        rest of sol2. A value of sol2 already present in the segment is
+        replaced by following the mapping segment of sol1 -> sol2. O(N)
+        '''
+        N = self.N
+        a, b = self.cut_points()
+
+        #  position of each value in sol1
+        pos1 = [0] * N
+        for i in xrange(N):
+            self.baro += 1
+            pos1[sol1[i]] = i
+
+        child = sol2[:]
+        child[a:b] = sol1[a:b]
+        for i in range(0, a) + range(b, N):
+            self.baro += 1
+            v = sol2[i]
+            while a <= pos1[v] < b:
+                self.baro += 1
+                v = sol2[pos1[v]]
+            child[i] = v
+        return child
+
+    def order_xover(self, sol1, sol2):
+        '''
+        Order crossover: the child takes a segment of sol1, the remaining
+        positions are filled with the missing values in the order they
+        appear in sol2 (starting after the segment). O(N)
+        '''
+        N = self.N
+        a, b = self.cut_points()
+
+        used = [False] * N
+        child = [-1] * N
+        for i in xrange(a, b):
+            self.baro += 1
+            child[i] = sol1[i]
+            used[sol1[i]] = True
+
+        j = b % N
+        for k in xrange(N):
+            self.baro += 1
+            v = sol2[(b + k) % N]
+            if not used[v]:
+                child[j] = v
+                j = (j + 1) % N
+        return child
+
+    def cycle_xover(self, sol1, sol2):
+        '''
+        Cycle crossover: the positions are split in cycles (sol1[i] is found
+        in sol2 at the next position of the cycle) and the child takes
+        alternatively the cycles of sol1 and sol2. O(N)
+        '''
+        N = self.N
+
+        #  position of each value in sol1
+        pos1 = [0] * N
+        for i in xrange(N):
+            self.baro += 1
+            pos1[sol1[i]] = i
+
+        child = [-1] * N
+        source = sol1
+        for start in xrange(N):
+            if child[start] != -1:
+                continue
+            j = start
+            while child[j] == -1:
+                self.baro += 1
+                child[j] = source[j]
+                j = pos1[sol2[j]]
+            if source is sol1:
+                source = sol2
+            else:
+                source = sol1
+        return child
+
+    def mutate_child(self, sol, score=None):
         '''
         This function randomly selects 2 bits in the solutions and swaps them
+        If the score of the solution is given ([fitness, diagonals,
+        anti-diagonals]) it is updated in place in O(1)
         '''
         self.baro += 1
-        r = sample(sol, 2)
+        r = self.rng.sample(sol, 2)
+        if score is not None:
+            self.baro += 4
+            score[0] -= swap_delta(sol, score[1], score[2], r[0], r[1])
         sol[r[0]], sol[r[1]] = sol[r[1]], sol[r[0]]
         return sol
 
@@ -152,7 +600,7 @@ class Population:
         '''
         Based on a small probability radiate a child with severe mutation
         '''
-        shuffle(sol)
+        self.rng.shuffle(sol)
         return sol
 
     def build_new_population(self):
@@ -163,43 +611,302 @@ class Population:
             3. Mutation (mutate children)
             4. Repeat until new population is same size as previous generation
         '''
-        new_population = []
-        alpha_parents = self.get_alpha_parents()
-        size = len(alpha_parents) - 1
+        profiler = self.profiler
+        if profiler is not None:
+            start = time()
+
+        if self.compact:
+            new_population = ChromosomeBuffer(self.N)
+        else:
+            new_population = []
+        xover = getattr(self, CROSSOVER_OPERATORS[self.crossover])
+        indices = self.select_parents()
+        alpha_parents = self.take_solutions(indices)
+
+        if profiler is not None:
+            profiler.add('selection', time() - start)
+
+        #  scores of the alpha parents (same order as alpha_parents)
+        alpha_scores = [self.counters[i] for i in indices]
 
-        for p in alpha_parents:
+        #  known scores of the new population, None when not known
+        scores = []
+
+        #  surviving parents keep their score
+        for i in xrange(len(alpha_parents)):
             self.baro += 1
-            new_population.append(p)
+            new_population.append(alpha_parents[i])
+            scores.append(alpha_scores[i])
 
         while len(new_population) < len(self.solutions):
             self.baro += 1
+            child, score = self.breed(alpha_parents, alpha_scores, xover)
 
-            #  random params we will measure probabilites of xover and mutation against
-            x = random()
-            y = random()
+            #  add children to new population
+            new_population.append(child)
+            scores.append(score)
 
-            #  check probability of crossover
-            if x <= self.xover_probability:
-                self.baro += 1
-                child = self.xover(alpha_parents[randint(0, size)], alpha_parents[randint(0, size)])
-            #  if no crossover the child will be one of the two parents
+        self.offspring = (new_population, scores)
+        return new_population
+
+    def breed(self, parents, parent_scores, xover):
+        '''
+        Create a child from the parents (crossover or clone, then mutation
+        and radiation). Returns the child and its score when it is known
+        (None otherwise)
+        '''
+        profiler = self.profiler
+        size = len(parents) - 1
+
+        #  random params we will measure probabilites of xover and mutation against
+        x = self.rng.random()
+        y = self.rng.random()
+
+        #  check probability of crossover
+        if x <= self.xover_probability:
+            self.baro += 1
+            if profiler is not None:
+                start = time()
+            child = xover(parents[self.rng.randint(0, size)],
+                          parents[self.rng.randint(0, size)])
+            score = None
+            if profiler is not None:
+                profiler.add('crossover', time() - start)
+        #  if no crossover the child will be one of the two parents
+        else:
+            self.baro += 1
+            a = self.rng.randint(0, size)
+            child = parents[a]
+            score = parent_scores[a]
+        #  check probability of mutation
+        if profiler is not None:
+            start = time()
+        if y <= self.mutation_rate:
+            self.baro += 1
+            if score is not None and score[1] is not None:
+                score = [score[0], score[1][:], score[2][:]]
             else:
+                score = None
+            child = self.mutate_child(child[:], score)
+
+        if y <= self.radiation_rate:
+            self.baro += 1
+            child = self.radiate_child(child[:])
+            score = None
+        if profiler is not None:
+            profiler.add('mutation', time() - start)
+        return child, score
+
+    def steady_state_step(self):
+        '''
+        One step of the steady-state mode: steady_state children are bred
+        from parents chosen by tournament and replace in place the least fit
+        individuals. Only the children are evaluated. The individuals are kept
+        in a min-heap of (fitness, index), a step costs O(k (N + log P))
+        instead of rebuilding the whole population
+        '''
+        profiler = self.profiler
+        if profiler is not None:
+            start = time()
+
+        heap = self.worst_heap
+        if heap is None:
+            heap = self.build_worst_heap()
+            self.baro += len(heap)
+
+        k = min(self.steady_state, len(heap))
+        xover = getattr(self, CROSSOVER_OPERATORS[self.crossover])
+        indices = [self.tournament() for j in xrange(2 * k)]
+        parents = self.take_solutions(indices)
+        parent_scores = [self.counters[i] for i in indices]
+
+        if profiler is not None:
+            profiler.add('selection', time() - start)
+
+        children = []
+        scores = []
+        for j in xrange(k):
+            self.baro += 1
+            child, score = self.breed(parents, parent_scores, xover)
+
+            #  a child with two queens on a row is replaced, as in
+            #  create_population
+            if len(child) != len(set(child)):
                 self.baro += 1
-                a = randint(0, size)
-                child = alpha_parents[a]
-            #  check probability of mutation
-            if y <= self.mutation_probability:
+                child = self.generate_random_solution()
+                score = None
+            children.append(child)
+            scores.append(score)
+
+        if profiler is not None:
+            start = time()
+        fit_vals, scores = self.score_rows(children, scores)
+        if profiler is not None:
+            profiler.add('evaluation', time() - start)
+
+        #  the k least fit individuals leave the heap before the children
+        #  come in, a child never replaces another child of the same step.
+        #  The best individual only leaves with the k least fit if the
+        #  others are as fit, the best of the population is then the best
+        #  of the heap and the children (or of the children alone when the
+        #  whole population is replaced)
+        self.generation += 1
+        worst = [heappop(heap)[1] for j in xrange(k)]
+        self.baro += k
+        if not heap:
+            self.heap_best = None
+        for j in xrange(k):
+            self.baro += 1
+            i = worst[j]
+            sol = children[j]
+            fit_val = fit_vals[j]
+            self.heap_sum += fit_val - self.fitness_vals[i]
+            if self.heap_best is None or fit_val > self.heap_best:
+                self.heap_best = fit_val
+            self.solutions[i] = sol
+            if not self.compact:
+                self.population[i] = sol
+            self.fitness_vals[i] = fit_val
+            self.counters[i] = scores[j]
+            heappush(heap, (fit_val, i))
+            if fit_val == 0:
+                key = chromosome_key(sol)
+                if key not in self.optimal_keys:
+                    self.add_optimal_solution(sol, key)
+
+        #  the statistics of a step are those of the whole population
+        if heap:
+            self.history.record_population(self.heap_best, heap[0][0], self.heap_sum, len(heap))
+        self.end_generation(self.population)
+
+    def build_worst_heap(self):
+        '''
+        Build the min-heap of (fitness, index) of the steady-state mode and
+        the sum and best of the fitness values
+        '''
+        fitness_vals = self.fitness_vals
+        heap = [(fitness_vals[i], i) for i in xrange(len(fitness_vals))]
+        heapify(heap)
+        self.heap_sum = sum(fitness_vals)
+        self.heap_best = max(fitness_vals) if heap else None
+        self.worst_heap = heap
+        return heap
+
+    def end_generation(self, population):
+        '''
+        Close the statistics of a generation, then measure its diversity for
+        the telemetry and the adaptive rates
+        '''
+        self.history.end_generation(self.generation)
+        if len(population) == 0:
+            return
+        if self.telemetry is None and self.adaptive is None:
+            return
+
+        diversity = population_diversity(population)
+        if self.telemetry is not None:
+            self.telemetry.record(self.history.last(), diversity,
+                                  len(self.optimal_solutions), self.evaluations)
+        if self.adaptive is not None:
+            self.mutation_rate, self.radiation_rate = self.adaptive.update(diversity)
+
+    def score_rows(self, rows, scores=None):
+        '''
+        Fitness values and scores of rows (valid chromosomes). Known scores
+        (cloned or mutated children) are kept, images of known optimal
+        solutions (symmetry mode), duplicates (dedup mode) and cached results
+        are not evaluated again, the rest is evaluated in one batch
+        Returns the fitness values and the scores
+        '''
+        size = len(rows)
+        if scores is None:
+            scores = [None] * size
+        else:
+            scores = scores[:]
+
+        #  score already known (cloned or mutated child)
+        fit_vals = [None] * size
+        for j in xrange(size):
+            if scores[j] is not None:
                 self.baro += 1
-                child = self.mutate_child(child[:])
+                fit_vals[j] = scores[j][0]
 
-            if y <= 0.005:
+        #  images of known optimal solutions do not need to be evaluated
+        if self.symmetry and self.optimal_keys:
+            for j in xrange(size):
+                if fit_vals[j] is None:
+                    self.baro += 1
+                    if chromosome_key(rows[j]) in self.optimal_keys:
+                        fit_vals[j] = 0
+
+        #  identical solutions share a single evaluation
+        duplicates = {}
+        if self.dedup:
+            first = {}
+            for j in xrange(size):
                 self.baro += 1
-                child = self.radiate_child(child[:])
+                key = chromosome_key(rows[j])
+                if key not in first:
+                    first[key] = j
+                elif fit_vals[j] is None:
+                    duplicates[j] = first[key]
 
-            #  add children to new population
-            new_population.append(child)
+        pending = [j for j in xrange(size) if fit_vals[j] is None and j not in duplicates]
 
-        return new_population
+        #  solutions evaluated in a previous generation
+        keys = {}
+        if self.cache is not None:
+            remaining = []
+            for j in pending:
+                self.baro += 1
+                key = chromosome_key(rows[j])
+                cached = self.cache.get(key)
+                if cached is None:
+                    keys[j] = key
+                    remaining.append(j)
+                else:
+                    fit_vals[j], scores[j] = cached
+            pending = remaining
+
+        #  evaluate every solution without a known score
+        if pending:
+            if isinstance(rows, ChromosomeBuffer):
+                #  compact mode: the rows stay packed up to the engine
+                solutions = rows.take(pending)
+            else:
+                solutions = [rows[j] for j in pending]
+            if self.pool is not None:
+                new_scores, b = self.score_parallel(solutions)
+            else:
+                new_scores, b = score_solutions(solutions, self.fitness_engine, self.incremental,
+                                                self.barometer == 'exact')
+            self.baro += b
+            self.evaluations += len(pending)
+            for k in xrange(len(pending)):
+                j = pending[k]
+                scores[j] = new_scores[k]
+                fit_vals[j] = new_scores[k][0]
+
+        if self.cache is not None:
+            for j in pending:
+                self.cache.put(keys[j], (fit_vals[j], scores[j]))
+
+        for j, k in duplicates.iteritems():
+            self.baro += 1
+            fit_vals[j] = fit_vals[k]
+            scores[j] = scores[k]
+
+        return fit_vals, scores
+
+    def next_generation(self):
+        '''
+        Evolve the population by one generation (one step in steady-state
+        mode)
+        '''
+        if self.steady_state > 0:
+            self.steady_state_step()
+        else:
+            self.regenerate_population(self.build_new_population())
 
     def get_alpha_parents(self):
         '''
@@ -207,30 +914,250 @@ class Population:
         The new generation will be composed of these parents and
         offspring after they are crossed
         '''
+        return self.take_solutions(self.select_parents())
+
+    def select_parents(self):
+        '''
+        Returns the indices of the parents of the next generation (half of
+        the population) chosen with the selection strategy:
+            - sort: full sort on (fitness, solution), most fit half
+            - nlargest: partial selection of the most fit half on fitness only
+            - tournament: best of tournament_size random individuals, repeated
+            - sus: stochastic universal sampling proportional to fitness
+        '''
+        fitness_vals = self.fitness_vals
+        pop_size = len(fitness_vals)
+        size = pop_size / 2
+        count = pop_size - size
+
+        if self.selection == 'sort':
+            if self.compact:
+                #  packed rows compare like the lists they hold
+                data = self.solutions.data
+                N = self.N
+                key = lambda i: (fitness_vals[i], data[i * N:(i + 1) * N])
+            else:
+                solutions = self.solutions
+                key = lambda i: (fitness_vals[i], solutions[i])
+            order = sorted(xrange(pop_size), key=key)
+            self.baro += 2 * pop_size
+            return order[size:]
+
+        if self.selection == 'nlargest':
+            self.baro += pop_size
+            return nlargest(count, xrange(pop_size), key=fitness_vals.__getitem__)
+
+        if self.selection == 'tournament':
+            return [self.tournament() for i in xrange(count)]
+
+        #  stochastic universal sampling: fitness values are shifted so that
+        #  the worst individual still has a weight of 1
+        worst = min(fitness_vals)
+        weights = [f - worst + 1 for f in fitness_vals]
+        step = float(sum(weights)) / count
+        pointer = self.rng.random() * step
+        parents = []
+        cumulative = 0
+        for i in xrange(pop_size):
+            self.baro += 1
+            cumulative += weights[i]
+            while pointer < cumulative and len(parents) < count:
+                parents.append(i)
+                pointer += step
+        return parents
+
+    def tournament(self):
+        '''
+        Index of the fittest of tournament_size individuals drawn at random
+        '''
+        fitness_vals = self.fitness_vals
+        last = len(fitness_vals) - 1
+        best = self.rng.randint(0, last)
+        for j in xrange(self.tournament_size - 1):
+            self.baro += 1
+            k = self.rng.randint(0, last)
+            if fitness_vals[k] > fitness_vals[best]:
+                best = k
+        return best
 
-        #  reorder solutions and fitness_vals lists
-        sorted_zip = sorted(zip(self.fitness_vals, self.solutions))
-        self.solutions = [x for (y, x) in sorted_zip]
-        self.fitness_vals = [y for (y, x) in sorted_zip]
+    def take_solutions(self, indices):
+        '''
+        Returns the solutions at the given indices
+        '''
+        if self.compact:
+            return self.solutions.take(indices)
+        return [self.solutions[i] for i in indices]
 
-        for i in sorted_zip:
-            self.baro += 2
+    def get_best_individuals(self, k):
+        '''
+        Returns copies of the k most fit solutions of the population
+        '''
+        fitness_vals = self.fitness_vals
+        best = nlargest(k, xrange(len(fitness_vals)), key=fitness_vals.__getitem__)
+        self.baro += len(fitness_vals)
+        return [self.population[i][:] for i in best]
 
-        size = len(self.population)/2
+    def replace_worst(self, migrants):
+        '''
+        Replace the least fit solutions of the population by migrants
+        coming from another population
+        '''
+        if not migrants:
+            return
+        fitness_vals = self.fitness_vals
+        worst = nsmallest(len(migrants), xrange(len(fitness_vals)), key=fitness_vals.__getitem__)
+        new_scores, b = score_solutions(migrants, self.fitness_engine, self.incremental,
+                                        self.barometer == 'exact')
+        self.baro += len(fitness_vals) + b
+        self.worst_heap = None
+        self.evaluations += len(migrants)
 
-        #  return most fit half
-        return self.solutions[size:]
+        for k in xrange(len(worst)):
+            i = worst[k]
+            sol = migrants[k]
+            self.solutions[i] = sol
+            self.population[i] = sol
+            fitness_vals[i] = new_scores[k][0]
+            self.counters[i] = new_scores[k]
+            if new_scores[k][0] == 0:
+                key = chromosome_key(sol)
+                if key not in self.optimal_keys:
+                    self.add_optimal_solution(sol, key)
 
     def regenerate_population(self, new_population):
         '''
         This function mutates the Population object to the new generation.
         This uses less memory than creating new population objects each iteration.
         '''
+        scores = None
+        if self.offspring is not None and self.offspring[0] is new_population:
+            scores = self.offspring[1]
+        self.offspring = None
+
         self.solutions = new_population
         self.population = []
-        self.fitness_vals = []
-        self.create_population(self.N)
+        self.fitness_vals = self.new_fitness_vals()
+        self.counters = []
+        self.worst_heap = None
         self.generation += 1
+        self.create_population(self.N, scores)
+
+    def get_state(self):
+        '''
+        Snapshot of the population between two generations (see Checkpoint.py):
+        settings, chromosomes and fitness values packed in bytes, state of the
+        random generator, counters and optimal solutions. The diagonal
+        counters are not saved, they are recomputed by from_state
+        '''
+        N = self.N
+        cache = None
+        if self.cache is not None:
+            entries = self.cache.entries
+            cache = (self.cache.capacity, self.cache.hits, self.cache.misses,
+                     [(key, value[0], value[1][1] is not None)
+                      for key, value in entries.iteritems()])
+
+        return {
+            'N': N,
+            'xover_prob': self.xover_probability,
+            'mutation_prob': self.mutation_probability,
+            'options': dict(fitness_engine=self.fitness_engine, compact=self.compact,
+                            dedup=self.dedup, symmetry=self.symmetry,
+                            selection=self.selection, tournament_size=self.tournament_size,
+                            crossover=self.crossover, memetic_steps=self.memetic_steps,
+                            memetic_top=self.memetic_top, seed=self.seed,
+                            barometer=self.barometer, steady_state=self.steady_state,
+                            adaptive=self.adaptive and self.adaptive.target),
+            'rates': (self.mutation_rate, self.radiation_rate),
+            'population': ChromosomeBuffer(N, self.population).data.tostring(),
+            'fitness_vals': array('i', self.fitness_vals).tostring(),
+            'counters': ''.join(score_kind(score) for score in self.counters),
+            'optimal_solutions': ChromosomeBuffer(N, self.optimal_solutions).data.tostring(),
+            'first_solution_generation': self.first_solution_generation,
+            'rng': self.rng.getstate(),
+            'generation': self.generation,
+            'baro': self.baro,
+            'baro_memetic': self.baro_memetic,
+            'evaluations': self.evaluations,
+            'history': (self.history.best, list(self.history.recent)),
+            'cache': cache,
+            'worst_heap': self.worst_heap is not None,
+        }
+
+    @classmethod
+    def from_state(cls, state, **options):
+        '''
+        Rebuild a population saved by get_state, the run then continues
+        exactly as if it had not been interrupted. options are the settings
+        which do not change the course of the run (workers, history_size,
+        history_file, profile, telemetry_file). The history and telemetry
+        files are appended to
+        '''
+        N = state['N']
+        options.update(state['options'])
+        options['append_files'] = True
+        if state['cache'] is not None:
+            options['cache_size'] = state['cache'][0]
+        Pop = cls(N, [], state['xover_prob'], state['mutation_prob'], **options)
+
+        rows = ChromosomeBuffer(N)
+        rows.data.fromstring(state['population'])
+        fitness_vals = array('i')
+        fitness_vals.fromstring(state['fitness_vals'])
+        if Pop.compact:
+            Pop.solutions = rows
+            Pop.population = rows
+            Pop.fitness_vals = fitness_vals
+        else:
+            Pop.solutions = list(rows)
+            Pop.population = list(Pop.solutions)
+            Pop.fitness_vals = fitness_vals.tolist()
+
+        #  individuals which carried diagonal counters get them back
+        kinds = state['counters']
+        for i in xrange(len(fitness_vals)):
+            if kinds[i] == SCORE_COUNTERS:
+                Pop.counters.append([fitness_vals[i]] + list(diagonal_counters_fast(rows[i])[1:]))
+            elif kinds[i] == SCORE_FITNESS:
+                Pop.counters.append([fitness_vals[i], None, None])
+            else:
+                Pop.counters.append(None)
+
+        optimal = ChromosomeBuffer(N)
+        optimal.data.fromstring(state['optimal_solutions'])
+        for sol in optimal:
+            Pop.add_optimal_solution(sol, chromosome_key(sol))
+
+        if state['cache'] is not None:
+            capacity, Pop.cache.hits, Pop.cache.misses, entries = state['cache']
+            for key, fit_val, incremental in entries:
+                if incremental:
+                    sol = array(chromosome_typecode(N))
+                    sol.fromstring(key)
+                    score = [fit_val] + list(diagonal_counters_fast(sol)[1:])
+                else:
+                    score = [fit_val, None, None]
+                Pop.cache.entries[key] = (fit_val, score)
+
+        Pop.mutation_rate, Pop.radiation_rate = state['rates']
+        if Pop.adaptive is not None:
+            Pop.adaptive.diversity = population_diversity(Pop.population)
+        Pop.first_solution_generation = state['first_solution_generation']
+        Pop.rng.setstate(state['rng'])
+        Pop.generation = state['generation']
+        Pop.baro = state['baro']
+        Pop.baro_memetic = state['baro_memetic']
+        Pop.evaluations = state['evaluations']
+        Pop.history.best, recent = state['history']
+        Pop.history.recent.extend(recent)
+        if Pop.telemetry is not None:
+            Pop.telemetry.solutions = len(Pop.optimal_solutions)
+            Pop.telemetry.evaluations = Pop.evaluations
+
+        #  the heap of the steady-state mode only depends on the fitness values
+        if state['worst_heap']:
+            Pop.build_worst_heap()
+        return Pop
 
     def print_stats(self):
         '''
@@ -244,8 +1171,29 @@ class Population:
         print 'Nombre de generations:', self.generation
         print 'Probabilite de recombinaison:', self.xover_probability
         print 'Probabilite de mutation:', self.mutation_probability
+        if self.seed is not None:
+            print 'Graine aleatoire:', self.seed
         print 'Fitness de la meilleure solution:', self.get_best_fitness()
-        print 'Temps de calcul:', self.get_barometer_count()
+        if self.barometer == 'exact':
+            print 'Temps de calcul:', self.get_barometer_count()
+            if self.memetic_steps > 0:
+                print 'Temps de calcul (recherche locale):', self.baro_memetic
+        else:
+            print 'Temps de calcul: barometre desactive'
+        if self.steady_state > 0:
+            print 'Mode stationnaire: %i enfants par pas' % self.steady_state
+        if self.adaptive is not None:
+            print 'Taux adaptatifs: mutation %.3f, radiation %.3f (diversite %.3f)' % (
+                self.mutation_rate, self.radiation_rate, self.adaptive.diversity)
+        print 'Solutions distinctes:', self.count_distinct_solutions()
+        if self.symmetry:
+            print 'Solutions connues (images comprises):', self.count_known_solutions()
+        print 'Solutions fondamentales:', self.count_fundamental_solutions()
+        if self.profiler is not None:
+            for phase, seconds, share in self.profiler.report():
+                print 'Temps %s: %.3fs (%.1f%%)' % (phase, seconds, share)
+        if self.cache is not None:
+            print 'Cache de fitness: %i succes, %i echecs' % (self.cache.hits, self.cache.misses)
         print '================================================='
 
     def export_stats(self, outfile):
@@ -259,29 +1207,284 @@ class Population:
             f.write('Nombre de generation: %i\n' % self.generation)
             f.write('Probabilite de recombinaison: %f\n' % self.xover_probability)
             f.write('Probabilite de mutation: %f\n' % self.mutation_probability)
+            if self.seed is not None:
+                f.write('Graine aleatoire: %i\n' % self.seed)
             f.write('Fitness de la meilleure solution: %i\n' % self.get_best_fitness())
-            f.write('Temps de calcul: %i' % self.get_barometer_count())
+            if self.barometer == 'exact':
+                f.write('Temps de calcul: %i\n' % self.get_barometer_count())
+                if self.memetic_steps > 0:
+                    f.write('Temps de calcul (recherche locale): %i\n' % self.baro_memetic)
+            else:
+                f.write('Temps de calcul: barometre desactive\n')
+            if self.steady_state > 0:
+                f.write('Mode stationnaire: %i enfants par pas\n' % self.steady_state)
+            if self.adaptive is not None:
+                f.write('Taux adaptatifs: mutation %.3f, radiation %.3f (diversite %.3f)\n' % (
+                    self.mutation_rate, self.radiation_rate, self.adaptive.diversity))
+            if self.profiler is not None:
+                for phase, seconds, share in self.profiler.report():
+                    f.write('Temps %s: %.3fs (%.1f%%)\n' % (phase, seconds, share))
+            f.write('Solutions distinctes: %i\n' % self.count_distinct_solutions())
+            if self.symmetry:
+                f.write('Solutions connues (images comprises): %i\n'
+                        % self.count_known_solutions())
+            f.write('Solutions fondamentales: %i' % self.count_fundamental_solutions())
 
     def export_optimal_solutions(self, outfile):
         '''
         Write the optimal solutions found to a different text file
         '''
-        with open(outfile, 'w') as f:
-            if self.optimal_solutions:
-                for s in self.optimal_solutions:
-                    f.write(str(s).strip('(').strip(')'))
-                    f.write('\n')
-            else:
-                f.write('No solutions found')
+        write_solutions(outfile, self.optimal_solutions)
 
     def get_barometer_count(self):
-        return self.baro
+        '''
+        Returns the barometer count, local search included
+        '''
+        return self.baro + self.baro_memetic
 
     def get_best_fitness(self):
         '''
         Returns best fitness ever calculated
         '''
-        return max(self.all_fitness_results)
+        return self.history.best
+
+
+#  probability of radiating a child (see Population.radiate_child)
+RADIATION_PROBABILITY = 0.005
+
+
+#  available parent selection strategies (see Population.select_parents)
+SELECTION_STRATEGIES = ('sort', 'nlargest', 'tournament', 'sus')
+
+
+#  crossover operators: name -> Population method. legacy is the original
+#  operator, the others always produce valid permutations in O(N)
+CROSSOVER_OPERATORS = {
+    'legacy': 'xover',
+    'pmx': 'pmx_xover',
+    'ox': 'order_xover',
+    'cx': 'cycle_xover',
+}
+
+
+class ChromosomeBuffer(object):
+    '''
+    Compact storage of chromosomes: every row of N values is packed in a
+    single contiguous array (uint16, or uint32 for very large boards).
+    Rows are read and written as lists so the buffer can be used wherever a
+    list of solutions is expected
+    '''
+
+    __slots__ = ('N', 'data')
+
+    def __init__(self, N, solutions=()):
+        self.N = N
+        self.data = array(chromosome_typecode(N))
+        if getattr(solutions, 'typecode', None) == self.data.typecode:
+            #  rows already packed (file mapped in memory) are copied in one block
+            self.data.fromstring(solutions.tostring())
+            return
+        for s in solutions:
+            self.append(s)
+
+    def __len__(self):
+        return len(self.data) // self.N
+
+    def __getitem__(self, i):
+        N = self.N
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                rows = ChromosomeBuffer(N)
+                rows.data = self.data[start * N:max(start, stop) * N]
+                return rows
+            return self.take(xrange(start, stop, step))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chromosome index out of range')
+        return self.data[i * N:(i + 1) * N].tolist()
+
+    def __setitem__(self, i, sol):
+        N = self.N
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chromosome index out of range')
+        self.data[i * N:(i + 1) * N] = array(self.data.typecode, sol)
+
+    def __iter__(self):
+        data = self.data
+        N = self.N
+        for i in xrange(0, len(data), N):
+            yield data[i:i + N].tolist()
+
+    def append(self, sol):
+        '''
+        Add a chromosome at the end of the buffer
+        '''
+        if len(sol) != self.N:
+            raise ValueError('chromosome of length %i, expected %i' % (len(sol), self.N))
+        self.data.extend(sol)
+
+    def take(self, order):
+        '''
+        Returns a new buffer holding the rows given by order
+        '''
+        data = self.data
+        N = self.N
+        rows = ChromosomeBuffer(N)
+        for i in order:
+            rows.data.extend(data[i * N:(i + 1) * N])
+        return rows
+
+
+def population_diversity(population, samples=32):
+    '''
+    Estimate of the diversity of a population: mean proportion of different
+    genes between pairs of solutions. The pairs are taken at regular
+    intervals (solution i against solution i + size / 2) so the estimate
+    costs O(samples * N) and does not consume random numbers
+    '''
+    size = len(population)
+    if size < 2:
+        return 0.0
+    step = max(1, size // samples)
+    half = size // 2
+    distance = 0
+    pairs = 0
+    for i in xrange(0, size, step):
+        sol1 = population[i]
+        sol2 = population[(i + half) % size]
+        distance += sum(1 for a, b in zip(sol1, sol2) if a != b)
+        pairs += 1
+    return float(distance) / (pairs * len(sol1))
+
+
+#  kind of the score of an individual in a checkpoint: no score (image of a
+#  known solution, see create_population), fitness only, fitness and counters
+SCORE_NONE = '\x00'
+SCORE_FITNESS = '\x01'
+SCORE_COUNTERS = '\x02'
+
+
+def score_kind(score):
+    '''
+    Kind of a score (SCORE_NONE, SCORE_FITNESS or SCORE_COUNTERS)
+    '''
+    if score is None:
+        return SCORE_NONE
+    if score[1] is None:
+        return SCORE_FITNESS
+    return SCORE_COUNTERS
+
+
+def derive_seed(seed, stream):
+    '''
+    Seed of an independent random stream (island, worker...) derived from
+    a master seed. Returns None if seed is None
+    '''
+    if seed is None:
+        return None
+    return int(sha1('%i:%i' % (seed, stream)).hexdigest()[:15], 16)
+
+
+def write_solutions(outfile, solutions):
+    '''
+    Write solutions to a text file, one per line
+    '''
+    with open(outfile, 'w') as f:
+        if solutions:
+            for s in solutions:
+                f.write(str(s).strip('(').strip(')'))
+                f.write('\n')
+        else:
+            f.write('No solutions found')
+
+
+def chromosome_key(sol):
+    '''
+    Hashable key of a chromosome: its values packed in bytes
+    '''
+    return array(chromosome_typecode(len(sol)), sol).tostring()
+
+
+def score_solutions(solutions, engine, incremental, exact=True):
+    '''
+    Evaluate solutions with a fitness engine. Returns the list of scores
+    ([fitness, diagonals, anti-diagonals], diagonals being None when not
+    incremental) and the barometer count. When exact is False the engines
+    without barometer are used and the count is 0.
+    The numpy engine reads a ChromosomeBuffer without unpacking its rows and
+    evaluates the solutions in chunks of NUMPY_CHUNK_VALUES values, so its
+    temporary arrays do not grow with the population
+    '''
+    scores = []
+    baro = 0
+    if engine == 'numpy':
+        if isinstance(solutions, ChromosomeBuffer):
+            solutions = np.frombuffer(solutions.data, dtype=solutions.data.typecode).reshape(
+                -1, solutions.N)
+        size = len(solutions)
+        step = max(1, NUMPY_CHUNK_VALUES // len(solutions[0])) if size else 1
+        for start in xrange(0, size, step):
+            fit_vals, b, diags, anti_diags = calc_population_fitness(
+                np.asarray(solutions[start:start + step], dtype=np.intp))
+            baro += b
+            for k in xrange(len(fit_vals)):
+                if incremental:
+                    scores.append([int(fit_vals[k]), diags[k].tolist(), anti_diags[k].tolist()])
+                else:
+                    scores.append([int(fit_vals[k]), None, None])
+        if not exact:
+            baro = 0
+    elif not exact:
+        if incremental:
+            for sol in solutions:
+                fit_val, diags, anti_diags = diagonal_counters_fast(sol)
+                scores.append([fit_val, diags, anti_diags])
+        else:
+            calc_fitness = FAST_FITNESS_ENGINES[engine]
+            for sol in solutions:
+                scores.append([calc_fitness(sol), None, None])
+    elif incremental:
+        for sol in solutions:
+            fit_val, b, diags, anti_diags = diagonal_counters(sol)
+            scores.append([fit_val, diags, anti_diags])
+            baro += b
+    else:
+        calc_fitness = FITNESS_ENGINES[engine]
+        for sol in solutions:
+            fit_val, b = calc_fitness(sol)
+            scores.append([fit_val, None, None])
+            baro += b
+    return scores, baro
+
+
+def score_packed(task):
+    '''
+    Worker side of Population.score_parallel: evaluate a chunk of packed
+    chromosomes and return the packed fitness values, the barometer count
+    and the packed diagonal counters (None when not incremental)
+    '''
+    N, engine, incremental, exact, data = task
+    typecode = chromosome_typecode(N)
+    rows = array(typecode)
+    rows.fromstring(data)
+    if engine == 'numpy':
+        solutions = np.frombuffer(data, dtype=rows.typecode).reshape(-1, N)
+    else:
+        solutions = [rows[i:i + N].tolist() for i in xrange(0, len(rows), N)]
+    scores, baro = score_solutions(solutions, engine, incremental, exact)
+
+    fit_vals = array('i', [score[0] for score in scores])
+    if not incremental:
+        return fit_vals.tostring(), baro, None
+    counters = array(typecode)
+    for score in scores:
+        counters.extend(score[1])
+        counters.extend(score[2])
+    return fit_vals.tostring(), baro, counters.tostring()
 
 
 def calc_conflict(sol, xpos, ypos):
@@ -325,11 +1528,203 @@ def calc_fitness(sol):
         return -conflicts, baro
 
 
+def calc_fitness_diagonal(sol):
+    '''
+    Function to calculate fitness function of a solution in O(N).
+    Queens are counted per row, main diagonal (i - sol[i]) and
+    anti-diagonal (i + sol[i]); every queen already present on one of
+    these lines is a conflict with the queen being placed. The result is
+    identical to calc_fitness.
+    '''
+    fit_val, baro, diags, anti_diags = diagonal_counters(sol)
+    return fit_val, baro
+
+
+def diagonal_counters(sol):
+    '''
+    Same as calc_fitness_diagonal but also returns the diagonal and
+    anti-diagonal counters so the fitness can later be updated with swap_delta
+    '''
+    N = len(sol)
+    rows = [0] * N
+    diags = [0] * (2 * N - 1)
+    anti_diags = [0] * (2 * N - 1)
+    conflicts = 0
+    baro = 0
+
+    for i in xrange(N):
+        baro += 1
+        y = sol[i]
+        d = i - y + N - 1
+        a = i + y
+        conflicts += rows[y] + diags[d] + anti_diags[a]
+        rows[y] += 1
+        diags[d] += 1
+        anti_diags[a] += 1
+    return -conflicts, baro, diags, anti_diags
+
+
+def swap_delta(sol, diags, anti_diags, i, j):
+    '''
+    Update the diagonal counters of sol as if the queens of columns i and j
+    were swapped and return the variation of the number of conflicts.
+    Rows are unchanged by a swap so only 4 diagonals are touched.
+    sol itself is not modified.
+    '''
+    off = len(sol) - 1
+    yi = sol[i]
+    yj = sol[j]
+    delta = 0
+
+    #  remove both queens
+    diags[i - yi + off] -= 1
+    delta -= diags[i - yi + off]
+    anti_diags[i + yi] -= 1
+    delta -= anti_diags[i + yi]
+    diags[j - yj + off] -= 1
+    delta -= diags[j - yj + off]
+    anti_diags[j + yj] -= 1
+    delta -= anti_diags[j + yj]
+
+    #  place them back on swapped rows
+    delta += diags[i - yj + off]
+    diags[i - yj + off] += 1
+    delta += anti_diags[i + yj]
+    anti_diags[i + yj] += 1
+    delta += diags[j - yi + off]
+    diags[j - yi + off] += 1
+    delta += anti_diags[j + yi]
+    anti_diags[j + yi] += 1
+    return delta
+
+
+def calc_fitness_fast(sol):
+    '''
+    Same as calc_fitness without the barometer count (the three conflict
+    tests are exclusive for a given pair of queens)
+    '''
+    N = len(sol)
+    conflicts = 0
+    for i in xrange(N):
+        y = sol[i]
+        k = 1
+        for j in xrange(i + 1, N):
+            v = sol[j]
+            if v == y + k or v == y - k or v == y:
+                conflicts += 1
+            k += 1
+    return -conflicts
+
+
+def diagonal_counters_fast(sol):
+    '''
+    Same as diagonal_counters without the barometer count
+    '''
+    N = len(sol)
+    rows = [0] * N
+    diags = [0] * (2 * N - 1)
+    anti_diags = [0] * (2 * N - 1)
+    conflicts = 0
+    off = N - 1
+    for i in xrange(N):
+        y = sol[i]
+        d = i - y + off
+        a = i + y
+        conflicts += rows[y] + diags[d] + anti_diags[a]
+        rows[y] += 1
+        diags[d] += 1
+        anti_diags[a] += 1
+    return -conflicts, diags, anti_diags
+
+
+def calc_fitness_diagonal_fast(sol):
+    '''
+    Same as calc_fitness_diagonal without the barometer count
+    '''
+    return diagonal_counters_fast(sol)[0]
+
+
+def calc_population_fitness(population):
+    '''
+    Vectorized fitness of a whole population given as a 2-D numpy array of
+    shape (pop_size, N). Queens are grouped per row, main diagonal and
+    anti-diagonal of each individual with a single bincount for each kind
+    of line. Returns the fitness array, the barometer count and the
+    diagonal and anti-diagonal counters (2-D arrays)
+    '''
+    pop_size, N = population.shape
+    width = 2 * N - 1
+    cols = np.arange(N)
+
+    #  offset indices of each individual so all counters share one bincount
+    offsets = np.arange(pop_size)[:, None]
+
+    rows = np.bincount((population + offsets * N).ravel(),
+                       minlength=pop_size * N).reshape(pop_size, N)
+    diags = np.bincount((cols - population + (N - 1) + offsets * width).ravel(),
+                        minlength=pop_size * width).reshape(pop_size, width)
+    anti_diags = np.bincount((cols + population + offsets * width).ravel(),
+                             minlength=pop_size * width).reshape(pop_size, width)
+
+    #  a line holding c queens counts c * (c - 1) / 2 conflicts
+    conflicts = (rows * (rows - 1)).sum(axis=1)
+    conflicts += (diags * (diags - 1)).sum(axis=1)
+    conflicts += (anti_diags * (anti_diags - 1)).sum(axis=1)
+    conflicts //= 2
+
+    return -conflicts, pop_size * N, diags, anti_diags
+
+
+def calc_fitness_numpy(sol):
+    '''
+    Fitness of a single solution through calc_population_fitness
+    '''
+    fit_vals, baro, diags, anti_diags = calc_population_fitness(np.array([sol]))
+    return int(fit_vals[0]), baro
+
+
+def calc_fitness_verify(sol):
+    '''
+    Cross-check the diagonal engine against the pairwise reference
+    '''
+    res, baro = calc_fitness(sol)
+    res_diag, b = calc_fitness_diagonal(sol)
+    if res != res_diag:
+        raise ValueError('Fitness mismatch for %s: pairwise=%i diagonal=%i'
+                         % (sol, res, res_diag))
+    return res, baro + b
+
+
+#  number of values (pop_size x N) evaluated at once by the numpy engine
+NUMPY_CHUNK_VALUES = 1 << 16
+
+#  available fitness engines, selectable by name
+FITNESS_ENGINES = {
+    'pairwise': calc_fitness,
+    'diagonal': calc_fitness_diagonal,
+    'verify': calc_fitness_verify,
+}
+
+#  same engines without barometer, they return the fitness only
+FAST_FITNESS_ENGINES = {
+    'pairwise': calc_fitness_fast,
+    'diagonal': calc_fitness_diagonal_fast,
+    'verify': lambda sol: calc_fitness_verify(sol)[0],
+}
+
+if np is not None:
+    FITNESS_ENGINES['numpy'] = calc_fitness_numpy
+    FAST_FITNESS_ENGINES['numpy'] = lambda sol: calc_fitness_numpy(sol)[0]
+    DEFAULT_FITNESS_ENGINE = 'numpy'
+else:
+    DEFAULT_FITNESS_ENGINE = 'diagonal'
+
+
 def check_if_optimal(sol):
         '''
         Check if a solution is the optimal solution to the problem
         '''
-        res, b = calc_fitness(sol)
+        res, b = calc_fitness_diagonal(sol)
         if res == 0:
             return True
         else:
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+"""
+Reading and writing population files
+
+Two formats are read by --import:
+    - text: population size and N on the first two lines, then one
+      solution per line (values separated by spaces)
+    - binary: a 16 bytes header (magic, version, size of the values, N,
+      population size) followed by the rows packed as little endian uint16
+      (uint32 when N >= 65536). The file is mapped in memory, rows are only
+      decoded when they are read
+
+Usage:
+  PopulationFile.py convert <texte> <binaire>
+
+Options:
+  -h --help             Afficher cet ecran d'aide
+
+  <texte>               Fichier de population au format texte
+  <binaire>             Fichier de population binaire a ecrire
+"""
+
+from docopt import docopt
+from array import array
+from datetime import datetime
+import mmap
+import os
+import struct
+import sys
+
+#  header of the binary format: magic, version, bytes per value, N, size
+BINARY_MAGIC = 'NQPB'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBB2xII')
+
+#  formats of the solution files written by SolutionWriter
+SOLUTION_FORMATS = ('text', 'ints', 'binary')
+
+
+def chromosome_typecode(N):
+    '''
+    Smallest array typecode able to hold the values of a chromosome
+    '''
+    if N < 1 << 16:
+        return 'H'
+    return 'I'
+
+
+def parse_input_data(infile):
+    '''
+    Function parse data from input file
+    Saves the solutions in an array of arrays called sol_array
+    Returns N and sol_array
+    '''
+    N, rows = iter_text_population(infile)
+    sol_array = list(rows)
+    return N, sol_array
+
+
+def read_population(infile):
+    '''
+    Read a population file in text or binary format (chosen by the first
+    bytes of the file). Returns N and the solutions, a MappedPopulation for
+    the binary format
+    '''
+    with open(infile, 'rb') as f:
+        binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if binary:
+        population = MappedPopulation(infile)
+        return population.N, population
+    return parse_input_data(infile)
+
+
+class MappedPopulation(object):
+    '''
+    Read-only sequence of the solutions of a binary population file mapped
+    in memory. Rows are decoded as lists when read, a ChromosomeBuffer of
+    the same typecode copies the packed rows in one block
+    '''
+
+    __slots__ = ('N', 'size', 'typecode', 'map')
+
+    def __init__(self, infile):
+        with open(infile, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, itemsize, self.N, self.size = BINARY_HEADER.unpack_from(self.map)
+        if magic != BINARY_MAGIC:
+            raise ValueError('Fichier de population invalide: %s' % infile)
+        if version != BINARY_VERSION:
+            raise ValueError('Version de fichier de population inconnue: %i' % version)
+        self.typecode = chromosome_typecode(self.N)
+        if array(self.typecode).itemsize != itemsize:
+            raise ValueError('Taille de valeur inconnue: %i' % itemsize)
+        if len(self.map) < BINARY_HEADER.size + self.size * self.N * itemsize:
+            raise ValueError('Fichier de population tronque: %s' % infile)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError('chromosome index out of range')
+        row = array(self.typecode)
+        rowsize = self.N * row.itemsize
+        start = BINARY_HEADER.size + i * rowsize
+        row.fromstring(self.map[start:start + rowsize])
+        if sys.byteorder == 'big':
+            row.byteswap()
+        return row.tolist()
+
+    def __iter__(self):
+        for i in xrange(self.size):
+            yield self[i]
+
+    def tostring(self):
+        '''
+        Returns the packed rows (native byte order) as a read-only buffer
+        over the mapped file, without copy on little endian machines
+        '''
+        rows = buffer(self.map, BINARY_HEADER.size,
+                      self.size * self.N * array(self.typecode).itemsize)
+        if sys.byteorder == 'big':
+            swapped = array(self.typecode)
+            swapped.fromstring(rows)
+            swapped.byteswap()
+            return swapped.tostring()
+        return rows
+
+    def close(self):
+        '''
+        Unmap the file
+        '''
+        self.map.close()
+
+
+def write_binary_population(outfile, N, solutions):
+    '''
+    Write solutions (any iterable of rows of N values) in the binary format.
+    Rows are written as they come, the size is set in the header at the end
+    '''
+    typecode = chromosome_typecode(N)
+    with open(outfile, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, array(typecode).itemsize, N, 0))
+        size = 0
+        for sol in solutions:
+            if len(sol) != N:
+                raise ValueError('chromosome of length %i, expected %i' % (len(sol), N))
+            row = array(typecode, sol)
+            if sys.byteorder == 'big':
+                row.byteswap()
+            row.tofile(f)
+            size += 1
+        f.seek(0)
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, array(typecode).itemsize, N, size))
+    return size
+
+
+class SolutionWriter(object):
+    '''
+    Buffered file receiving the optimal solutions as soon as they are found,
+    so they can be read while the run goes on and are not lost if it stops.
+    Formats:
+        - text: same lines as the final export ([1, 3, 0, 2])
+        - ints: values separated by spaces, one solution per line
+        - binary: binary population format, the size in the header is
+          updated at every flush
+    The file is flushed after every write, a solution is visible as soon as
+    it is found (solutions are rare, the bulk of them come from write_many)
+    '''
+
+    __slots__ = ('out', 'N', 'format', 'typecode', 'count')
+
+    def __init__(self, outfile, N, solutions_format='text'):
+        if solutions_format not in SOLUTION_FORMATS:
+            raise ValueError('Format de solutions inconnu: %s' % solutions_format)
+        self.N = N
+        self.format = solutions_format
+        self.typecode = chromosome_typecode(N)
+        self.count = 0
+        self.out = open(outfile, 'wb', 1 << 16)
+        if solutions_format == 'binary':
+            self.write_header()
+
+    def write_header(self):
+        '''
+        Write the header of the binary format (number of solutions so far)
+        '''
+        self.out.seek(0)
+        self.out.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                                          array(self.typecode).itemsize, self.N, self.count))
+        self.out.seek(0, 2)
+
+    def write(self, sol):
+        '''
+        Append a solution to the file and flush it
+        '''
+        self.write_row(sol)
+        self.flush()
+
+    def write_many(self, solutions):
+        '''
+        Append solutions to the file, flushed once at the end
+        '''
+        for sol in solutions:
+            self.write_row(sol)
+        self.flush()
+
+    def write_row(self, sol):
+        '''
+        Append a solution to the buffer of the file
+        '''
+        if self.format == 'text':
+            self.out.write(str(list(sol)))
+            self.out.write('\n')
+        elif self.format == 'ints':
+            self.out.write(' '.join(map(str, sol)))
+            self.out.write('\n')
+        else:
+            row = array(self.typecode, sol)
+            if sys.byteorder == 'big':
+                row.byteswap()
+            row.tofile(self.out)
+        self.count += 1
+
+    def flush(self):
+        '''
+        Make the solutions written so far visible in the file
+        '''
+        if self.format == 'binary':
+            self.write_header()
+        self.out.flush()
+
+    def close(self):
+        '''
+        Flush and close the file
+        '''
+        if self.out is None:
+            return
+        if self.count == 0 and self.format == 'text':
+            self.out.write('No solutions found')
+        self.flush()
+        self.out.close()
+        self.out = None
+
+
+def generate_population(N, pop_size, rng):
+    '''
+    Generates a random population based on user input
+    '''
+    population = []
+    for i in xrange(pop_size):
+        solution = [x for x in range(N)]
+        rng.shuffle(solution)
+        population.append(solution)
+
+    return population
+
+
+def output_suffix():
+    '''
+    Suffix of the output files of a run: date and time to the microsecond
+    and process id, so runs started at the same time never share a file
+    '''
+    return '%s_%i' % (datetime.now().strftime('%Y-%m-%d_%H-%M-%S-%f'), os.getpid())
+
+
+def iter_text_population(infile):
+    '''
+    Returns N and a generator of the solutions of a text file, read one
+    line at a time (the file is never held in memory)
+    '''
+    f = open(infile, 'r')
+    f.readline()
+    N = int(f.readline())
+
+    def rows():
+        with f:
+            for line in f:
+
+                #  For each line we split and convert values to int
+                sol = map(int, line.split())
+
+                #  empty lines are skipped
+                if sol:
+                    yield sol
+    return N, rows()
+
+
+def convert_population(infile, outfile):
+    '''
+    Convert a text population file to the binary format, in constant memory.
+    Returns N and the number of solutions written
+    '''
+    N, rows = iter_text_population(infile)
+    return N, write_binary_population(outfile, N, rows)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    N, size = convert_population(arguments['<texte>'], arguments['<binaire>'])
+    print '%i solutions de %i reines converties' % (size, N)
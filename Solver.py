@@ -0,0 +1,207 @@
+'''
+Exact solver of the n-queens problem: backtracking over the columns with
+the occupied rows and diagonals kept in bitmasks, so placing a queen and
+listing the free rows of a column are O(1) integer operations.
+By symmetry (reflection of the rows) only the placements of the first queen
+in the upper half of the column are explored, each solution found there has
+a distinct mirror image starting in the lower half. The placements of the
+first queen are independent and can be split between processes.
+Solutions have the same form as in Population (sol[column] = row).
+'''
+
+from multiprocessing import Pool
+import time
+
+from Population import chromosome_key, write_solutions
+from PopulationFile import SolutionWriter
+from Symmetry import canonical_form
+
+
+def first_rows(N):
+    '''
+    Rows of the first queen explored by the solver: the upper half of the
+    column and the middle row when N is odd. Returns (row, mirrored) pairs,
+    mirrored telling whether the solutions have a mirror image to add
+    '''
+    rows = [(row, True) for row in xrange(N // 2)]
+    if N % 2:
+        rows.append((N // 2, False))
+    return rows
+
+
+def count_placements(full, rows, diags, anti_diags):
+    '''
+    Number of ways to complete a board whose occupied rows and diagonals
+    (as seen from the next column) are given as bitmasks
+    '''
+    if rows == full:
+        return 1
+    count = 0
+    free = full & ~(rows | diags | anti_diags)
+    while free:
+        bit = free & -free
+        free ^= bit
+        count += count_placements(full, rows | bit, ((diags | bit) << 1) & full,
+                                  (anti_diags | bit) >> 1)
+    return count
+
+
+def enumerate_placements(full, rows, diags, anti_diags, sol, solutions):
+    '''
+    Same as count_placements, the completed boards are appended to solutions
+    '''
+    if rows == full:
+        solutions.append(sol[:])
+        return
+    free = full & ~(rows | diags | anti_diags)
+    while free:
+        bit = free & -free
+        free ^= bit
+        sol.append(bit.bit_length() - 1)
+        enumerate_placements(full, rows | bit, ((diags | bit) << 1) & full,
+                             (anti_diags | bit) >> 1, sol, solutions)
+        sol.pop()
+
+
+def solve_first_row(task):
+    '''
+    Solve the boards whose first queen is on the given row. Returns the
+    number of solutions and, unless count_only, the solutions (mirror
+    images included)
+    '''
+    N, row, mirrored, count_only = task
+    full = (1 << N) - 1
+    bit = 1 << row
+    if count_only:
+        count = count_placements(full, bit, (bit << 1) & full, bit >> 1)
+        if mirrored:
+            count *= 2
+        return count, None
+
+    solutions = []
+    enumerate_placements(full, bit, (bit << 1) & full, bit >> 1, [row], solutions)
+    if mirrored:
+        last = N - 1
+        solutions.extend([[last - y for y in sol] for sol in solutions])
+    return len(solutions), solutions
+
+
+def count_solutions(N, workers=1):
+    '''
+    Number of solutions of the n-queens problem
+    '''
+    tasks = [(N, row, mirrored, True) for row, mirrored in first_rows(N)]
+    if workers > 1:
+        pool = Pool(workers)
+        results = pool.map(solve_first_row, tasks)
+        pool.close()
+        pool.join()
+    else:
+        results = map(solve_first_row, tasks)
+    return sum(count for count, solutions in results)
+
+
+class ExactSolver(object):
+    '''
+    Counts or enumerates every solution of a board with the bitmask
+    solver. Shares the reporting interface of Population (statistics,
+    export and streaming of the solutions) so n-queens.py can use both
+    '''
+
+    def __init__(self, N, workers=1, count_only=False):
+        self.N = N
+        self.workers = workers
+        self.count_only = count_only
+        self.count = 0
+        self.optimal_solutions = []
+        self.fundamental_keys = set()
+        self.solution_writer = None
+        self.wall_time = 0.0
+
+    def stream_solutions(self, outfile, solutions_format='text'):
+        '''
+        Write the solutions to outfile as soon as each first-row placement
+        is solved (see Population.stream_solutions)
+        '''
+        self.solution_writer = SolutionWriter(outfile, self.N, solutions_format)
+
+    def run(self):
+        '''
+        Solve the board, the first-row placements are split between
+        the processes
+        '''
+        start = time.time()
+        tasks = [(self.N, row, mirrored, self.count_only) for row, mirrored in first_rows(self.N)]
+        pool = None
+        if self.workers > 1:
+            pool = Pool(self.workers)
+            results = pool.imap(solve_first_row, tasks)
+        else:
+            results = (solve_first_row(task) for task in tasks)
+
+        for count, solutions in results:
+            self.count += count
+            if solutions is None:
+                continue
+            for sol in solutions:
+                self.fundamental_keys.add(chromosome_key(canonical_form(sol)))
+            self.optimal_solutions.extend(solutions)
+            if self.solution_writer is not None:
+                self.solution_writer.write_many(solutions)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        self.wall_time = time.time() - start
+        if self.count_only:
+            return '%i solutions comptees' % self.count
+        return '%i solutions enumerees' % self.count
+
+    def get_best_fitness(self):
+        if self.count:
+            return 0
+        return None
+
+    def print_stats(self):
+        '''
+        Print relevant stats
+        '''
+        print
+        print '================================================='
+        print 'Statistiques:'
+        print 'Nombre de reines:', self.N
+        print 'Resolution exacte (retour arriere)'
+        print 'Nombre de processus:', self.workers
+        print 'Temps de resolution: %.3fs' % self.wall_time
+        print 'Solutions distinctes:', self.count
+        if not self.count_only:
+            print 'Solutions fondamentales:', len(self.fundamental_keys)
+        print '================================================='
+
+    def export_stats(self, outfile):
+        '''
+        Function to export stats to text file.
+        '''
+        with open(outfile, 'w') as f:
+            f.write('Statistiques:\n')
+            f.write('Nombre de reines: %i\n' % self.N)
+            f.write('Resolution exacte (retour arriere)\n')
+            f.write('Nombre de processus: %i\n' % self.workers)
+            f.write('Temps de resolution: %.3fs\n' % self.wall_time)
+            f.write('Solutions distinctes: %i' % self.count)
+            if not self.count_only:
+                f.write('\nSolutions fondamentales: %i' % len(self.fundamental_keys))
+
+    def export_optimal_solutions(self, outfile):
+        '''
+        Write the solutions found to a text file
+        '''
+        write_solutions(outfile, self.optimal_solutions)
+
+    def close(self):
+        '''
+        Flush and close the solution stream
+        '''
+        if self.solution_writer is not None:
+            self.solution_writer.close()
+            self.solution_writer = None
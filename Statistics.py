@@ -0,0 +1,182 @@
+from collections import deque
+from time import time
+import json
+
+
+class FitnessHistory(object):
+    '''
+    Running statistics of the fitness values computed during a run.
+    Keeps the best fitness ever seen, the best/mean/worst of each generation
+    in a ring buffer of recent generations and optionally spills the full
+    history to a text file instead of keeping it in memory (appended to
+    when a run is resumed)
+    '''
+
+    __slots__ = ('best', 'recent', 'spill', 'gen_best', 'gen_worst', 'gen_sum', 'gen_count')
+
+    def __init__(self, history_size=100, spill_file=None, append=False):
+        #  best fitness ever seen
+        self.best = None
+
+        #  (generation, best, mean, worst) of the most recent generations
+        self.recent = deque(maxlen=history_size)
+
+        #  file receiving the full history (one line per generation)
+        self.spill = None
+        if spill_file is not None:
+            self.spill = open(spill_file, 'a' if append else 'w')
+            if self.spill.tell() == 0:
+                self.spill.write('generation best mean worst\n')
+
+        #  statistics of the generation being evaluated
+        self.gen_best = None
+        self.gen_worst = None
+        self.gen_sum = 0
+        self.gen_count = 0
+
+    def record(self, fit_val):
+        '''
+        Add a fitness value to the current generation
+        '''
+        if self.gen_count == 0:
+            self.gen_best = fit_val
+            self.gen_worst = fit_val
+        elif fit_val > self.gen_best:
+            self.gen_best = fit_val
+        elif fit_val < self.gen_worst:
+            self.gen_worst = fit_val
+        self.gen_sum += fit_val
+        self.gen_count += 1
+
+        if self.best is None or fit_val > self.best:
+            self.best = fit_val
+
+    def record_population(self, best, worst, total, count):
+        '''
+        Set the statistics of the current generation at once (best, worst,
+        sum and number of fitness values), when they are known without going
+        through every value
+        '''
+        self.gen_best = best
+        self.gen_worst = worst
+        self.gen_sum = total
+        self.gen_count = count
+
+        if self.best is None or best > self.best:
+            self.best = best
+
+    def end_generation(self, generation):
+        '''
+        Close the current generation and store its statistics
+        '''
+        if self.gen_count == 0:
+            return
+        stats = (generation, self.gen_best, float(self.gen_sum) / self.gen_count, self.gen_worst)
+        self.recent.append(stats)
+        if self.spill is not None:
+            self.spill.write('%i %i %f %i\n' % stats)
+
+        self.gen_best = None
+        self.gen_worst = None
+        self.gen_sum = 0
+        self.gen_count = 0
+
+    def last(self):
+        '''
+        Returns (generation, best, mean, worst) of the last generation
+        '''
+        if self.recent:
+            return self.recent[-1]
+        return None
+
+    def close(self):
+        '''
+        Flush and close the history file
+        '''
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+class Profiler(object):
+    '''
+    Accumulates the wall-clock time spent in each phase of the algorithm
+    (selection, crossover, mutation, evaluation, local search)
+    '''
+
+    __slots__ = ('phases',)
+
+    #  order in which the phases are reported
+    PHASES = ('selection', 'crossover', 'mutation', 'evaluation', 'local_search')
+
+    def __init__(self):
+        self.phases = dict.fromkeys(self.PHASES, 0.0)
+
+    def add(self, phase, seconds):
+        '''
+        Add time spent in a phase
+        '''
+        self.phases[phase] += seconds
+
+    def report(self):
+        '''
+        Returns (phase, seconds, percentage of the total) for each phase
+        '''
+        total = sum(self.phases.values()) or 1.0
+        return [(phase, self.phases[phase], 100.0 * self.phases[phase] / total)
+                for phase in self.PHASES]
+
+
+class Telemetry(object):
+    '''
+    JSON lines sink receiving one record per generation (best, mean and
+    worst fitness, diversity, new solutions, evaluations, elapsed time).
+    Writes are buffered and flushed at most once per flush_interval seconds
+    so a live run can be followed without slowing it down. A resumed run
+    appends to the file of the interrupted one
+    '''
+
+    __slots__ = ('out', 'start', 'last_flush', 'flush_interval', 'solutions', 'evaluations')
+
+    def __init__(self, outfile, flush_interval=1.0, append=False):
+        self.out = open(outfile, 'a' if append else 'w', 1 << 16)
+        self.start = time()
+        self.last_flush = self.start
+        self.flush_interval = flush_interval
+
+        #  totals at the previous record
+        self.solutions = 0
+        self.evaluations = 0
+
+    def record(self, stats, diversity, solutions, evaluations):
+        '''
+        Write the record of a generation. stats is (generation, best, mean,
+        worst), solutions and evaluations are totals since the start of the run
+        '''
+        now = time()
+        generation, best, mean, worst = stats
+        self.out.write(json.dumps({
+            'generation': generation,
+            'best': best,
+            'mean': mean,
+            'worst': worst,
+            'diversity': diversity,
+            'new_solutions': solutions - self.solutions,
+            'evaluations': evaluations - self.evaluations,
+            'elapsed': now - self.start,
+        }, sort_keys=True))
+        self.out.write('\n')
+        self.solutions = solutions
+        self.evaluations = evaluations
+
+        if now - self.last_flush >= self.flush_interval:
+            self.out.flush()
+            self.last_flush = now
+
+    def close(self):
+        '''
+        Flush and close the telemetry file
+        '''
+        if self.out is not None:
+            self.out.close()
+            self.out = None
@@ -0,0 +1,38 @@
+'''
+Symmetries of the n-queens board.
+A solution is a permutation (sol[column] = row). The 8 rotations and
+reflections of the board are obtained by combining the reflection of the
+columns, the reflection of the rows and the transposition (inverse
+permutation), each computed in O(N).
+'''
+
+
+def symmetries(sol):
+    '''
+    Returns the 8 images of a solution under the rotations and reflections
+    of the board (some may be identical for symmetric solutions)
+    '''
+    N = len(sol)
+    last = N - 1
+
+    inverse = [0] * N
+    for i in xrange(N):
+        inverse[sol[i]] = i
+
+    images = []
+    for p in (sol, inverse):
+        p = list(p)
+        flipped = [last - y for y in p]
+        images.append(p)
+        images.append(p[::-1])
+        images.append(flipped)
+        images.append(flipped[::-1])
+    return images
+
+
+def canonical_form(sol):
+    '''
+    Canonical representative of a solution: the smallest (lexicographic)
+    of its 8 images. Solutions related by a symmetry share the same form
+    '''
+    return min(symmetries(sol))
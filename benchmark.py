@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+
+"""
+ELE440 Labo4 - Banc d'essai de l'algorithme genetique
+
+Usage:
+  benchmark.py run [options]
+  benchmark.py sweep [options]
+  benchmark.py compare <reference> <resultats> [--tolerance=<pct>]
+
+Options:
+  -h --help               Afficher cet ecran d'aide
+  --datasets=<motif>      Fichiers de population a evaluer [default: evaluation/*.txt]
+  --xover=<liste>         Probabilites de recombinaison (separees par des virgules)
+                          [default: 0.3,0.9]
+  --mutation=<liste>      Probabilites de mutation (separees par des virgules)
+                          [default: 0.1,0.9]
+  --seeds=<liste>         Graines aleatoires (separees par des virgules) [default: 1,2,3]
+  --queens=<liste>        sweep: nombres de reines (separes par des virgules) [default: 8,12]
+  --sizes=<liste>         sweep: tailles de population (separees par des virgules)
+                          [default: 50,100]
+  --processes=<k>         sweep: nombre d'executions simultanees [default: 1]
+  --iterations=<n>        Nombre de generations par execution [default: 100]
+  --fitness=<moteur>      Moteur de fitness (voir n-queens.py)
+  --selection=<s>         Strategie de selection [default: sort]
+  --crossover=<op>        Operateur de recombinaison [default: legacy]
+  --memetic=<steps>       Budget de recherche locale par generation [default: 0]
+  --steady-state=<k>      Enfants par pas en mode stationnaire (0: generationnel) [default: 0]
+  --adaptive=<d>          Seuil de diversite des taux adaptatifs (voir n-queens.py)
+  --barometer=<mode>      Barometre: exact ou off (colonne barometer vide) [default: exact]
+  --output=<fichier>      Rapport (.csv ou .json), par defaut output/benchmark.json
+                          (run) ou output/sweep_<date>_<pid>.csv (sweep)
+  --tolerance=<pct>       Ecart tolere avant de signaler une regression [default: 10]
+
+  <reference>             Rapport de reference (.csv ou .json)
+  <resultats>             Rapport a comparer a la reference
+"""
+
+from docopt import docopt
+from glob import glob
+from multiprocessing import Pool
+import csv
+import json
+import os
+import resource
+import sys
+import time
+
+from Population import Population, derive_seed
+from PopulationFile import generate_population, output_suffix, read_population
+from Solver import count_solutions
+from random import Random
+
+#  columns of the report
+FIELDS = ['dataset', 'N', 'pop_size', 'pb_xover', 'pb_mutation', 'seed', 'generations',
+          'wall_time', 'barometer', 'evaluations', 'evaluations_per_sec',
+          'first_solution_generation', 'solutions', 'best_fitness', 'peak_rss_kb',
+          'solution_space', 'solution_fraction', 'solution_fraction_per_sec']
+
+#  largest board whose solutions are counted by the exact solver to report
+#  the fraction of the solution space found by a run
+SOLVER_LIMIT = 12
+
+#  measures compared by the compare mode (lower is better)
+COMPARED = ['wall_time', 'barometer', 'evaluations']
+
+#  columns of the sweep table (one row per setting, aggregated over seeds)
+SWEEP_FIELDS = ['N', 'pop_size', 'pb_xover', 'pb_mutation', 'runs', 'success_rate',
+                'median_time_to_solution', 'median_generations', 'mean_evaluations']
+
+
+def run_once(task):
+    '''
+    Run the genetic algorithm once on a dataset and return its measures.
+    Executed in a fresh process so the peak memory is the one of this run
+    '''
+    dataset, xover_prob, mutation_prob, seed, iterations, options = task
+    N, solutions = read_population(dataset)
+    pop_size = len(solutions)
+
+    start = time.time()
+    Pop = Population(N, solutions, xover_prob, mutation_prob, seed=seed, **options)
+    for i in xrange(iterations):
+        Pop.next_generation()
+    wall_time = time.time() - start
+    Pop.close()
+
+    #  ground truth of the exact solver (not timed)
+    solution_space = None
+    solution_fraction = None
+    solution_fraction_per_sec = None
+    if N <= SOLVER_LIMIT:
+        solution_space = count_solutions(N)
+        if solution_space:
+            solution_fraction = float(Pop.count_distinct_solutions()) / solution_space
+            if wall_time > 0:
+                solution_fraction_per_sec = solution_fraction / wall_time
+
+    return {
+        'dataset': os.path.basename(dataset),
+        'N': N,
+        'pop_size': pop_size,
+        'pb_xover': xover_prob,
+        'pb_mutation': mutation_prob,
+        'seed': seed,
+        'generations': Pop.generation,
+        'wall_time': wall_time,
+        'barometer': Pop.get_barometer_count() if Pop.barometer == 'exact' else None,
+        'evaluations': Pop.evaluations,
+        'evaluations_per_sec': Pop.evaluations / wall_time if wall_time > 0 else 0.0,
+        'first_solution_generation': Pop.first_solution_generation,
+        'solutions': len(Pop.optimal_solutions),
+        'best_fitness': Pop.get_best_fitness(),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'solution_space': solution_space,
+        'solution_fraction': solution_fraction,
+        'solution_fraction_per_sec': solution_fraction_per_sec,
+    }
+
+
+def sweep_once(task):
+    '''
+    Run the genetic algorithm on a generated population until the first
+    solution or the last generation. Returns whether a solution was found
+    and the time taken
+    '''
+    N, pop_size, xover_prob, mutation_prob, seed, iterations, options = task
+    solutions = generate_population(N, pop_size, Random(derive_seed(seed, 0)))
+
+    start = time.time()
+    Pop = Population(N, solutions, xover_prob, mutation_prob, seed=seed, **options)
+    while Pop.generation < iterations and not Pop.optimal_solutions:
+        Pop.next_generation()
+    wall_time = time.time() - start
+    Pop.close()
+
+    return {
+        'N': N,
+        'pop_size': pop_size,
+        'pb_xover': xover_prob,
+        'pb_mutation': mutation_prob,
+        'seed': seed,
+        'solved': bool(Pop.optimal_solutions),
+        'generations': Pop.generation,
+        'wall_time': wall_time,
+        'evaluations': Pop.evaluations,
+    }
+
+
+def median(values):
+    '''
+    Median of a list of numbers, None if it is empty
+    '''
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        return None
+    if n % 2:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+
+def aggregate_sweep(results):
+    '''
+    Group the runs of a sweep by setting (N, population size, probabilities)
+    and compute the success rate and the median time to the first solution
+    (over the successful runs)
+    '''
+    groups = {}
+    order = []
+    for r in results:
+        key = (r['N'], r['pop_size'], r['pb_xover'], r['pb_mutation'])
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(r)
+
+    table = []
+    for key in order:
+        runs = groups[key]
+        solved = [r for r in runs if r['solved']]
+        table.append({
+            'N': key[0],
+            'pop_size': key[1],
+            'pb_xover': key[2],
+            'pb_mutation': key[3],
+            'runs': len(runs),
+            'success_rate': float(len(solved)) / len(runs),
+            'median_time_to_solution': median([r['wall_time'] for r in solved]),
+            'median_generations': median([r['generations'] for r in solved]),
+            'mean_evaluations': float(sum(r['evaluations'] for r in runs)) / len(runs),
+        })
+    return table
+
+
+def print_sweep(table):
+    '''
+    Print the sweep table
+    '''
+    print '%6s %8s %8s %8s %6s %8s %12s %12s' % ('N', 'pop', 'xover', 'mutation', 'runs',
+                                                 'succes', 'temps med.', 'gen. med.')
+    for row in table:
+        time_to_solution = row['median_time_to_solution']
+        generations = row['median_generations']
+        print '%6i %8i %8.2f %8.2f %6i %7.0f%% %12s %12s' % (
+            row['N'], row['pop_size'], row['pb_xover'], row['pb_mutation'], row['runs'],
+            100 * row['success_rate'],
+            '-' if time_to_solution is None else '%.3fs' % time_to_solution,
+            '-' if generations is None else '%g' % generations)
+
+
+def write_report(outfile, results, fields=FIELDS):
+    '''
+    Write the results to a CSV or JSON file (chosen by extension)
+    '''
+    with open(outfile, 'w') as f:
+        if outfile.endswith('.csv'):
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            for r in results:
+                writer.writerow(r)
+        else:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+def read_report(infile):
+    '''
+    Read a report written by write_report
+    '''
+    with open(infile, 'r') as f:
+        if not infile.endswith('.csv'):
+            return json.load(f)
+        results = []
+        for row in csv.DictReader(f):
+            for field in COMPARED + ['pb_xover', 'pb_mutation']:
+                #  empty cell: measure not taken (barometer off)
+                row[field] = float(row[field]) if row[field] else None
+            row['seed'] = int(row['seed'])
+            results.append(row)
+        return results
+
+
+def run_key(r):
+    '''
+    Identifies the same run in two reports
+    '''
+    return (r['dataset'], float(r['pb_xover']), float(r['pb_mutation']), int(r['seed']))
+
+
+def compare_reports(reference, results, tolerance):
+    '''
+    Print the relative variation of each measure between two reports and
+    return the number of regressions above tolerance (in percent)
+    '''
+    reference = dict((run_key(r), r) for r in reference)
+    regressions = 0
+    for r in results:
+        ref = reference.get(run_key(r))
+        if ref is None:
+            continue
+        line = '%s xover=%s mutation=%s seed=%s' % run_key(r)
+        for field in COMPARED:
+            if not ref[field] or r[field] is None:
+                continue
+            change = 100.0 * (r[field] - ref[field]) / ref[field]
+            flag = ''
+            if change > tolerance:
+                flag = ' REGRESSION'
+                regressions += 1
+            line += '  %s %+.1f%%%s' % (field, change, flag)
+        print line
+    return regressions
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, version='1.0')
+
+    if arguments['compare']:
+        regressions = compare_reports(read_report(arguments['<reference>']),
+                                      read_report(arguments['<resultats>']),
+                                      float(arguments['--tolerance']))
+        print '%i regression(s)' % regressions
+        sys.exit(1 if regressions else 0)
+
+    options = dict(fitness_engine=arguments['--fitness'], selection=arguments['--selection'],
+                   crossover=arguments['--crossover'],
+                   memetic_steps=int(arguments['--memetic']),
+                   steady_state=int(arguments['--steady-state']),
+                   adaptive=arguments['--adaptive'] and float(arguments['--adaptive']),
+                   barometer=arguments['--barometer'])
+    iterations = int(arguments['--iterations'])
+
+    if arguments['sweep']:
+        tasks = []
+        for N in arguments['--queens'].split(','):
+            for pop_size in arguments['--sizes'].split(','):
+                for xover_prob in arguments['--xover'].split(','):
+                    for mutation_prob in arguments['--mutation'].split(','):
+                        for seed in arguments['--seeds'].split(','):
+                            tasks.append((int(N), int(pop_size), float(xover_prob),
+                                          float(mutation_prob), int(seed), iterations, options))
+
+        #  runs are independent, each one in a fresh process of the pool
+        pool = Pool(int(arguments['--processes']), maxtasksperchild=1)
+        results = pool.map(sweep_once, tasks)
+        pool.close()
+        pool.join()
+
+        table = aggregate_sweep(results)
+        print_sweep(table)
+        write_report(arguments['--output'] or 'output/sweep_%s.csv' % output_suffix(), table,
+                     SWEEP_FIELDS)
+        sys.exit(0)
+
+    tasks = []
+    for dataset in sorted(glob(arguments['--datasets'])):
+        for xover_prob in arguments['--xover'].split(','):
+            for mutation_prob in arguments['--mutation'].split(','):
+                for seed in arguments['--seeds'].split(','):
+                    tasks.append((dataset, float(xover_prob), float(mutation_prob), int(seed),
+                                  iterations, options))
+
+    #  one process per run (maxtasksperchild) to measure its own peak memory,
+    #  runs are sequential so timings do not interfere
+    pool = Pool(1, maxtasksperchild=1)
+    results = []
+    for r in pool.imap(run_once, tasks):
+        print '%(dataset)s xover=%(pb_xover)s mutation=%(pb_mutation)s seed=%(seed)i: ' \
+              '%(wall_time).2fs, %(evaluations_per_sec).0f eval/s, ' \
+              'premiere solution: %(first_solution_generation)s' % r
+        if r['solution_fraction'] is not None:
+            print '    %.2f%% des %i solutions trouvees' % (100 * r['solution_fraction'],
+                                                       r['solution_space'])
+        results.append(r)
+    pool.close()
+    pool.join()
+
+    write_report(arguments['--output'] or 'output/benchmark.json', results)
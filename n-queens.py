@@ -4,14 +4,69 @@
 ELE440 Labo4 - Algorithmes genetiques
 
 Usage:
-  n-queens.py --import <fichier> <iterations> <pb_xover> <pb_mutation>
-  n-queens.py --generate <N> <pop_size> <iterations> <pb_xover> <pb_mutation>
+  n-queens.py --import <fichier> <iterations> <pb_xover> <pb_mutation> [options]
+  n-queens.py --generate <N> <pop_size> <iterations> <pb_xover> <pb_mutation> [options]
+  n-queens.py --solve <N> [options]
 
 Options:
   -h --help             Afficher cet ecran d'aide
   --version             Afficher la version.
+  --fitness=<moteur>    Moteur de fitness: numpy, diagonal, pairwise ou verify
+                        (numpy si disponible, sinon diagonal)
+  --compact             Population compacte (tableaux contigus, moins de memoire)
+  --dedup               Evaluer une seule fois les solutions identiques d'une generation
+  --symmetry            Ne pas reevaluer ni enregistrer les rotations et reflexions
+                        des solutions deja trouvees
+  --cache=<taille>      Taille du cache LRU des fitness (0 pour desactiver) [default: 0]
+  --workers=<k>         Nombre de processus pour evaluer la population (avec --solve,
+                        pour se partager les placements de la premiere reine)
+                        [default: 1]
+  --islands=<k>         Nombre d'iles (populations evoluant en parallele) [default: 1]
+  --migration=<m>       Nombre de generations entre deux migrations [default: 10]
+  --migrants=<n>        Nombre d'individus envoyes par ile a chaque migration [default: 2]
+  --topology=<t>        Topologie de migration: ring ou full [default: ring]
+  --history=<taille>    Nombre de generations gardees en memoire dans l'historique
+                        des fitness [default: 100]
+  --history-file=<fichier>  Ecrire l'historique complet des fitness dans ce fichier
+                        (un fichier par ile, numero ajoute avant l'extension)
+  --selection=<s>       Strategie de selection: sort, nlargest, tournament ou sus
+                        [default: sort]
+  --tournament-size=<k>  Nombre d'individus par tournoi [default: 3]
+  --crossover=<op>      Operateur de recombinaison: legacy, pmx, ox ou cx
+                        [default: legacy]
+  --memetic=<steps>     Mode memetique: budget de recherche locale (echanges) par
+                        generation, 0 pour desactiver [default: 0]
+  --memetic-top=<k>     Nombre de meilleures solutions ameliorees par generation
+                        [default: 2]
+  --steady-state=<k>    Mode stationnaire: a chaque pas, k enfants remplacent les k
+                        individus les moins bons, le nombre d'iterations compte
+                        alors les pas (0 pour le mode generationnel) [default: 0]
+  --adaptive=<d>        Augmenter la mutation et la radiation quand la diversite de
+                        la population (0 a 1) descend sous d
+  --seed=<graine>       Graine aleatoire (tiree au hasard et affichee si absente)
+  --barometer=<mode>    Barometre: exact (compte chaque operation) ou off (moteurs
+                        sans comptage) [default: exact]
+  --profile             Mesurer le temps passe dans chaque phase de l'algorithme
+                        (temps de toutes les iles additionnes)
+  --telemetry=<fichier>  Ecrire les statistiques de chaque generation (JSON lines,
+                        un fichier par ile comme pour --history-file)
+  --stream=<format>     Ecrire les solutions des qu'elles sont trouvees dans le
+                        fichier de solutions, au format text, ints (entiers separes
+                        par des espaces) ou binary (format binaire des populations)
+  --checkpoint=<fichier>  Sauvegarder regulierement l'etat de l'execution dans ce
+                        fichier (point de reprise)
+  --checkpoint-every=<g>  Nombre de generations entre deux sauvegardes [default: 50]
+  --resume              Reprendre l'execution sauvegardee dans le fichier de reprise
+                        s'il existe (la population et ses parametres sont lus
+                        dans le fichier)
+  --count               Avec --solve, compter les solutions sans les enumerer
+  --stop-first          Arreter des que la premiere solution est trouvee
+  --stop-after=<k>      Arreter apres k solutions distinctes
+  --time-limit=<sec>    Arreter apres un budget de temps (secondes)
+  --stagnation=<g>      Arreter si la meilleure fitness ne s'ameliore pas
+                        pendant g generations
 
-  <fichier>             Fichier d'entree
+  <fichier>             Fichier d'entree (texte ou binaire, voir PopulationFile.py)
   <iterations>          Nombre maximal de generations
   <N>                   Nombre de reines (taille de l'echiquier)
   <pb_xover>            Probabilite de recombinaison
@@ -21,43 +76,65 @@ Options:
 
 from docopt import docopt
 import sys
-from random import shuffle
-from Population import Population
-import datetime
+from random import Random, SystemRandom
+from Population import Population, derive_seed
+from PopulationFile import generate_population, output_suffix, read_population
+from Islands import Archipelago
+from Solver import ExactSolver
+from Checkpoint import load_checkpoint, save_checkpoint
+import os
+import time
 
 
-def parse_input_data(infile):
+def run_genetic_algorithm(Pop, max_iter, stop_first=False, stop_after=None,
+                          time_limit=None, stagnation=None, checkpoint=None,
+                          checkpoint_every=50):
     '''
-    Function parse data from input file
-    Saves the solutions in an array of arrays called sol_array
-    Returns N and sol_array
+    Evolve the population until max_iter generations or until one of the
+    optional stopping criteria is met:
+        - stop_first: first optimal solution found
+        - stop_after: number of distinct optimal solutions found
+        - time_limit: wall-clock budget in seconds
+        - stagnation: generations without improvement of the best fitness
+    If checkpoint is given, the state of the population is saved in this
+    file every checkpoint_every generations. Returns the reason why the
+    loop stopped
     '''
-    with open(infile, 'r') as f:
-        f.readline()
-        N = int(f.readline())
-        sol_array = []
-        for line in f.readlines():
+    start = time.time()
+    best = Pop.get_best_fitness()
 
-            #  For each line we split and convert values to int before adding to array
-            sol = [int(x) for x in line.split()]
+    #  a resumed population starts at the generation it was saved
+    iterations = Pop.generation
+    last_improvement = iterations
 
-            #  If array is not empty we append it to array of solutions
-            if sol:
-                sol_array.append(sol)
-        return N, sol_array
+    #  Genetic algorithm loop starts here
+    while iterations < max_iter:
+        if stop_first and Pop.optimal_solutions:
+            return 'premiere solution trouvee'
+        if stop_after and len(Pop.optimal_solutions) >= stop_after:
+            return '%i solutions trouvees' % len(Pop.optimal_solutions)
+        if time_limit and time.time() - start >= time_limit:
+            return 'budget de temps ecoule'
+        if stagnation and iterations - last_improvement >= stagnation:
+            return 'aucune amelioration depuis %i generations' % stagnation
 
+        print_iterations = 'Iteration=%i' % iterations
+        Printer(print_iterations)
 
-def generate_population(N, pop_size):
-    '''
-    Generates a random population based on user input
-    '''
-    population = []
-    for i in xrange(pop_size):
-        solution = [x for x in range(N)]
-        shuffle(solution)
-        population.append(solution)
+        #  create the next generation (a single step in steady-state mode)
+        Pop.next_generation()
+
+        #  increment generations
+        iterations += 1
+
+        if Pop.get_best_fitness() > best:
+            best = Pop.get_best_fitness()
+            last_improvement = iterations
+
+        if checkpoint and iterations % checkpoint_every == 0:
+            save_checkpoint(checkpoint, Pop.get_state())
 
-    return population
+    return 'nombre maximal de generations atteint'
 
 
 class Printer():
@@ -71,67 +148,138 @@ class Printer():
 
 if __name__ == '__main__':
 
-    #  create timestamp
-    timestamp = datetime.datetime.now()
-    #  human readable format
-    timestamp = timestamp.strftime("%Y-%m-%d_%H-%M-%S")
+    #  create timestamp (human readable, with the process id so that runs
+    #  started at the same time do not overwrite each other)
+    timestamp = output_suffix()
 
     # parse argumentst
     arguments = docopt(__doc__, version='1.0')
+
+    #  exact solver: every solution of the board, same statistics and export
+    if arguments['--solve']:
+        N = int(arguments['<N>'])
+        Solver = ExactSolver(N, int(arguments['--workers']), arguments['--count'])
+        outfile_stats = 'output/N%i_exact_%s.txt' % (N, timestamp)
+        outfile_sols = 'output/solutions_N%i_exact_%s.txt' % (N, timestamp)
+        STREAM = arguments['--stream']
+        if STREAM:
+            if STREAM == 'binary':
+                outfile_sols = outfile_sols[:-len('.txt')] + '.bin'
+            Solver.stream_solutions(outfile_sols, STREAM)
+        stop_reason = Solver.run()
+        Solver.print_stats()
+        print 'Arret:', stop_reason
+        Solver.export_stats(outfile_stats)
+        if not STREAM and not arguments['--count']:
+            Solver.export_optimal_solutions(outfile_sols)
+        Solver.close()
+        sys.exit(0)
     MAX_ITER = int(arguments['<iterations>'])
     XOVER_PROB = float(arguments['<pb_xover>'])
     MUTATION_PROB = float(arguments['<pb_mutation>'])
+    FITNESS_ENGINE = arguments['--fitness']
+    COMPACT = arguments['--compact']
+    DEDUP = arguments['--dedup']
+    SYMMETRY = arguments['--symmetry']
+    CACHE_SIZE = int(arguments['--cache'])
+    WORKERS = int(arguments['--workers'])
+    HISTORY_SIZE = int(arguments['--history'])
+    HISTORY_FILE = arguments['--history-file']
+    STOP_FIRST = arguments['--stop-first']
+    STOP_AFTER = arguments['--stop-after'] and int(arguments['--stop-after'])
+    TIME_LIMIT = arguments['--time-limit'] and float(arguments['--time-limit'])
+    STAGNATION = arguments['--stagnation'] and int(arguments['--stagnation'])
+    CHECKPOINT = arguments['--checkpoint']
+    CHECKPOINT_EVERY = int(arguments['--checkpoint-every'])
 
-    if arguments['--import'] is True:
-        INFILE = arguments['<fichier>']
-        N, solutions = parse_input_data(INFILE)
-        Pop = Population(N, solutions, XOVER_PROB, MUTATION_PROB)
-        optimal_solutions = []
-        iterations = 0
+    ISLANDS = int(arguments['--islands'])
+    if CHECKPOINT and ISLANDS > 1:
+        sys.exit('Les points de reprise ne sont pas disponibles avec plusieurs iles')
+    if arguments['--resume'] and not CHECKPOINT:
+        sys.exit('--resume demande le fichier de reprise (--checkpoint)')
+    RESUME = arguments['--resume'] and os.path.exists(CHECKPOINT)
 
-        #  Genetic algorithm loop starts here
-        while iterations < MAX_ITER:
-            print_iterations = 'Iteration=%i' % iterations
-            Printer(print_iterations)
+    #  without a seed one is drawn so the run can still be reproduced
+    if arguments['--seed'] is not None:
+        SEED = int(arguments['--seed'])
+    else:
+        SEED = SystemRandom().randint(0, 2 ** 31 - 1)
 
-            #  create the next generation
-            next_generation = Pop.build_new_population()
+    options = dict(fitness_engine=FITNESS_ENGINE, compact=COMPACT, history_size=HISTORY_SIZE,
+                   history_file=HISTORY_FILE, dedup=DEDUP, symmetry=SYMMETRY,
+                   cache_size=CACHE_SIZE, workers=WORKERS, selection=arguments['--selection'],
+                   tournament_size=int(arguments['--tournament-size']),
+                   crossover=arguments['--crossover'], memetic_steps=int(arguments['--memetic']),
+                   memetic_top=int(arguments['--memetic-top']), seed=SEED,
+                   barometer=arguments['--barometer'], profile=arguments['--profile'],
+                   telemetry_file=arguments['--telemetry'],
+                   steady_state=int(arguments['--steady-state']),
+                   adaptive=arguments['--adaptive'] and float(arguments['--adaptive']))
 
-            #  modify the current population to the new one
-            Pop.regenerate_population(next_generation)
+    if RESUME:
+        state = load_checkpoint(CHECKPOINT)
+
+    elif arguments['--import'] is True:
+        INFILE = arguments['<fichier>']
+        N, solutions = read_population(INFILE)
 
-            #  increment generations
-            iterations += 1
+        #  the imported population is shared between the islands
+        if ISLANDS > 1:
+            populations = [solutions[i::ISLANDS] for i in xrange(ISLANDS)]
+        else:
+            populations = [solutions]
 
     elif arguments['--generate'] is True:
         N = int(arguments['<N>'])
         pop_size = int(arguments['<pop_size>'])
-        solutions = generate_population(N, pop_size)
-        Pop = Population(N, solutions, XOVER_PROB, MUTATION_PROB)
-        optimal_solutions = []
-        iterations = 0
+        rng = Random(derive_seed(SEED, 0))
+        populations = [generate_population(N, pop_size, rng) for i in xrange(ISLANDS)]
 
-        #  Genetic algorithm loop starts here
-        while iterations < MAX_ITER:
-            print_iterations = 'Iteration=%i' % iterations
-            Printer(print_iterations)
+    if RESUME:
+        #  the population and its settings come from the checkpoint, only the
+        #  options which do not change the course of the run are taken here
+        Pop = Population.from_state(state, history_size=HISTORY_SIZE,
+                                    history_file=HISTORY_FILE, workers=WORKERS,
+                                    profile=arguments['--profile'],
+                                    telemetry_file=arguments['--telemetry'])
+        N = Pop.N
+        populations = [Pop.population]
+    elif ISLANDS > 1:
+        Pop = Archipelago(N, populations, XOVER_PROB, MUTATION_PROB, arguments['--topology'],
+                          int(arguments['--migration']), int(arguments['--migrants']), **options)
+    else:
+        Pop = Population(N, populations[0], XOVER_PROB, MUTATION_PROB, **options)
 
-            #  create the next generation
-            next_generation = Pop.build_new_population()
+    pop_size = sum(len(solutions) for solutions in populations)
+    outfile_stats = 'output/N%iP%i_%s.txt' % (N, pop_size, timestamp)
+    outfile_sols = 'output/solutions_N%iP%i_%s.txt' % (N, pop_size, timestamp)
 
-            #  modify the current population to the new one
-            Pop.regenerate_population(next_generation)
+    #  solutions written as soon as they are found
+    STREAM = arguments['--stream']
+    if STREAM:
+        if STREAM == 'binary':
+            outfile_sols = outfile_sols[:-len('.txt')] + '.bin'
+        Pop.stream_solutions(outfile_sols, STREAM)
 
-            #  increment generations
-            iterations += 1
+    if ISLANDS > 1:
+        stop_reason = Pop.run(MAX_ITER, STOP_FIRST, STOP_AFTER, TIME_LIMIT, STAGNATION,
+                              progress=Printer)
+    else:
+        stop_reason = run_genetic_algorithm(Pop, MAX_ITER, STOP_FIRST, STOP_AFTER,
+                                            TIME_LIMIT, STAGNATION, CHECKPOINT,
+                                            CHECKPOINT_EVERY)
 
-    outfile_stats = 'output/N%iP%i_%s.txt' % (N, len(solutions), timestamp)
-    outfile_sols = 'output/solutions_N%iP%i_%s.txt' % (N, len(solutions), timestamp)
+    #  last checkpoint, a finished run can be continued with more generations
+    if CHECKPOINT:
+        save_checkpoint(CHECKPOINT, Pop.get_state())
 
     Pop.print_stats()
+    print 'Arret:', stop_reason
     if Pop.optimal_solutions:
         print 'Found %i solutions' % len(Pop.optimal_solutions)
         for s in Pop.optimal_solutions:
             print s
     Pop.export_stats(outfile_stats)
-    Pop.export_optimal_solutions(outfile_sols)
+    if not STREAM:
+        Pop.export_optimal_solutions(outfile_sols)
+    Pop.close()